@@ -10,3 +10,6 @@ warnings.warn('"allure.adaptor" is deprecated, use "allure.pytest_plugin" instea
 
 # impersonate the old ``adaptor``
 from allure.pytest_plugin import *  # @UnusedWildImport  # noqa
+# the plugin imports those when it needs them, but the old ``adaptor`` had them
+from allure.structure import TestCase, TestStep, Attach, TestSuite, Failure, TestLabel  # noqa
+from allure.utils import parent_down_from_module, mangle_testnames  # noqa
@@ -0,0 +1,250 @@
+"""
+Aggregation of reported test cases into suites and writing of those.
+
+:py:class:`ResultAggregator` does it in the pytest process,
+:py:class:`ProcessAggregator` hands the same calls to a :py:class:`ResultAggregator` in a dedicated subprocess,
+so building and writing of the report does not compete with tests for the GIL.
+"""
+
+import json
+import signal
+import multiprocessing
+from functools import partial
+
+from allure.common import AllureImpl
+from allure.constants import AttachmentType, FAILED_STATUSES
+from allure.durations import DurationDB
+from allure.payload import PayloadDecoder
+from allure.structure import TestSuite, Attach, Failure
+from allure.summary import SessionSummary
+from allure.utils import uid
+from allure.writers import XMLDirectoryWriter, writer_class
+
+
+class ResultAggregator(object):
+    """
+    Collects test cases into suites and writes those with ``impl`` when finished.
+
+    Also feeds the cases to ``summary`` (a :py:class:`allure.summary.SessionSummary`)
+    and to ``durations`` (a :py:class:`allure.durations.DurationDB`), if those are given.
+
+    Suites get ``labels`` (a list of :py:class:`allure.structure.TestLabel`), if those are given.
+    The environment is not written if ``store_environment`` is not set, as when some other process writes it.
+
+    If ``dedupe_traces`` is set, traces of failed cases are written as attachments, once for all the same ones.
+    """
+
+    def __init__(self, impl, summary=None, durations=None, labels=None, store_environment=True, dedupe_traces=False):
+        self.impl = impl
+        self.summary = summary
+        self.durations = durations
+        self.labels = labels or []
+        self.store_environment = store_environment
+        self.dedupe_traces = dedupe_traces
+
+        # module's nodeid => TestSuite object
+        self.suites = {}
+        self.decoder = PayloadDecoder()
+        self.traces = {}  # hash of a trace => its attachment file name
+
+    def add_result(self, nodeid, payload):
+        """
+        Adds a result of test ``nodeid`` from the :py:class:`allure.pytest_plugin.AllureTestListener`.
+
+        ``payload`` is made by a :py:class:`allure.payload.PayloadEncoder`
+        """
+        module_id, module_name, module_doc, environment, testcase = self.decoder.decode(nodeid, payload)
+
+        self.impl.environment.update(environment)
+
+        for a in testcase.iter_attachments():
+            self.write_attach(a)
+
+        if self.dedupe_traces and testcase.status in FAILED_STATUSES and testcase.failure and testcase.failure.trace:
+            self.dedupe_trace(testcase)
+
+        if self.summary:
+            self.summary.add(module_name, testcase)
+
+        if self.durations:
+            self.durations.record(nodeid, testcase.stop - testcase.start)
+
+        if self.impl.writer.streaming:
+            self.impl.writer.write_case(module_id, module_name, module_doc, testcase)
+            return
+
+        self.suites.setdefault(module_id, TestSuite(name=module_name,
+                                                    description=module_doc,
+                                                    tests=[],
+                                                    labels=list(self.labels),
+                                                    start=testcase.start,  # first case starts the suite!
+                                                    stop=None)).tests.append(testcase)
+
+    def add_suite(self, suite):
+        """
+        Writes finished :py:class:`allure.structure.TestSuite` ``suite`` as is
+        """
+        self.impl.writer.write_suite(suite)
+
+    def add_environment(self, environment):
+        """
+        Adds ``environment`` dict, as reported by some other process
+        """
+        self.impl.environment.update(environment)
+
+    def write_attach(self, attachment):
+        """
+        Writes attachment object from the `AllureTestListener` to the FS, fixing it fields
+
+        :param attachment: a :py:class:`allure.structure.Attach` object
+        """
+
+        # OMG, that is bad
+        attachment.source = self.impl._save_attach(attachment.source, attachment.type)
+        attachment.type = attachment.type.mime_type
+
+    def dedupe_trace(self, testcase):
+        """
+        Moves trace of ``testcase`` to an attachment, that is shared with cases with the same trace,
+        and marks its failure message with a short signature of the trace
+        """
+        failure = testcase.failure
+        key = uid(failure.trace.encode('utf-8'))
+        signature = key[:8]
+
+        source = self.traces.get(key)
+        if source is None:
+            source = self.traces[key] = self.impl._save_attach(failure.trace, AttachmentType.TEXT)
+
+        testcase.failure = Failure(message=u'%s [trace %s]' % (failure.message or u'', signature),
+                                   trace=u'See the trace %s attachment' % signature)
+        testcase.attachments.append(Attach(source=source, title=u'Trace %s' % signature, type=AttachmentType.TEXT.mime_type))
+
+    def finish(self):
+        """
+        We are done and have all the results in `self.suites`
+        Lets write em down.
+
+        But first we kinda-unify the test cases.
+
+        We expect cases to come from AllureTestListener -- and the have ._id field to manifest their identity.
+
+        Of all the test cases in suite.testcases we leave LAST with the same ID -- becase logreport can be sent MORE THAN ONE TIME
+        (namely, if the test fails and then gets broken -- to cope with the xdist's -x behavior we have to have tests even at CALL failures)
+
+        TODO: do it in a better, more efficient way
+        """
+
+        for s in self.suites.values():
+            if s.tests:  # nobody likes empty suites
+                s.stop = max(case.stop for case in s.tests)
+
+                known_ids = set()
+                refined_tests = []
+                for t in s.tests[::-1]:
+                    if t.id not in known_ids:
+                        known_ids.add(t.id)
+                        refined_tests.append(t)
+                s.tests = refined_tests[::-1]
+
+                self.impl.writer.write_suite(s)
+
+        if self.store_environment:
+            self.impl.store_environment()
+
+        if self.summary:
+            self.impl.writer.write_file('summary.json', json.dumps(self.summary.to_dict(), indent=1, sort_keys=True))
+
+        if self.durations:
+            self.durations.save()
+
+    def close(self):
+        self.impl.close()
+
+
+def make_aggregator(reportdir, writer, summary_size=None, durations_path=None, dedupe_traces=False):
+    """
+    Returns a :py:class:`ResultAggregator` that writes with ``writer`` (a name for :py:func:`allure.writers.writer_class`)
+    to ``reportdir``, keeps a summary of ``summary_size`` if that is given and durations at ``durations_path`` if that is given.
+    """
+    return ResultAggregator(AllureImpl(reportdir, writer_class(writer)(reportdir)),
+                            SessionSummary(summary_size) if summary_size else None,
+                            DurationDB(durations_path) if durations_path else None,
+                            dedupe_traces=dedupe_traces)
+
+
+def serve(queue, factory):
+    """
+    Runs a :py:class:`ResultAggregator` built by ``factory`` for calls from the ``queue`` till ``None`` comes
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # ctrl+c is for the pytest process, it finishes us itself
+
+    aggregator = factory()
+    for method, args in iter(queue.get, None):
+        getattr(aggregator, method)(*args)
+
+    aggregator.finish()
+    aggregator.close()
+
+
+class ProcessAggregator(object):
+    """
+    Has the API of :py:class:`ResultAggregator`, but hands the calls over a queue
+    to a :py:class:`ResultAggregator` in a subprocess, made there with :py:func:`make_aggregator` from ``kw``.
+
+    Finishing waits for the subprocess to write everything, for ``timeout`` seconds at most.
+    If the subprocess has died, calls are dropped and finishing fails.
+    """
+
+    def __init__(self, timeout=300, **kw):
+        self.timeout = timeout
+
+        # a report directory that cannot be made fails the session here, as it does without the subprocess
+        if issubclass(writer_class(kw['writer']), XMLDirectoryWriter):
+            XMLDirectoryWriter(kw['reportdir'])
+
+        self.queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(self.queue, partial(make_aggregator, **kw)), name='allure-writer')
+        self.process.daemon = True
+        self.process.start()
+
+    def add_result(self, nodeid, payload):
+        self._put(('add_result', (nodeid, payload)))
+
+    def add_suite(self, suite):
+        self._put(('add_suite', (suite,)))
+
+    def add_environment(self, environment):
+        self._put(('add_environment', (environment,)))
+
+    def _put(self, call):
+        if self.process.is_alive():
+            self.queue.put(call)
+        else:
+            self._abandon()
+
+    def _abandon(self):
+        """
+        Drops what is queued for the subprocess that is gone, so exiting does not wait to flush that into a pipe nobody reads
+        """
+        self.queue.cancel_join_thread()
+        self.queue.close()
+
+    def finish(self):
+        if self.process.is_alive():
+            self.queue.put(None)
+            self.process.join(self.timeout)
+
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+                self._abandon()
+                raise RuntimeError('Allure writer process did not finish in %s seconds' % self.timeout)
+
+        if self.process.exitcode:
+            self._abandon()
+            raise RuntimeError('Allure writer process failed with exit code %s' % self.process.exitcode)
+
+    def close(self):
+        if self.process.is_alive():
+            self.finish()
@@ -0,0 +1,93 @@
+"""
+asyncio support for steps.
+
+Uses ``async`` syntax, so :py:mod:`allure.common` imports it on Python 3.6+ only.
+"""
+
+import sys
+import inspect
+from functools import wraps
+
+
+class AsyncStepContextMixin(object):
+    """
+    Lets a :py:class:`allure.common.StepContext` be used with ``async with``.
+    """
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return self.__exit__(exc_type, exc_val, exc_tb)
+
+
+class NullStep(object):
+    """
+    Stands for the step of an async generator when nothing records steps.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def suspend(self):
+        pass
+
+    def resume(self):
+        pass
+
+
+def wrap_async(func, context):
+    """
+    Wraps a coroutine function or an async generator function ``func`` so its execution is recorded as a step.
+
+    :param context: called with the call arguments, returns :py:class:`allure.common.StepContext` or ``None`` when nothing records steps
+    :returns: the wrapper or ``None`` if ``func`` is a regular function
+    """
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def impl(*a, **kw):
+            step = context(a, kw)
+            if step is None:
+                return await func(*a, **kw)
+
+            with step:
+                return await func(*a, **kw)
+
+        return impl
+
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def gen_impl(*a, **kw):
+            step = context(a, kw)
+            if step is None:
+                step = NullStep()
+
+            # values and exceptions of the consumer go on to the generator, as with ``yield from``.
+            # the step lasts while the generator is iterated, but is on the stack only while it runs:
+            # a consumer that stops early closes it later, maybe from another task, and steps it starts meanwhile are not its
+            gen = func(*a, **kw)
+            try:
+                with step:
+                    try:
+                        item = await gen.__anext__()
+                        while True:
+                            step.suspend()
+                            try:
+                                sent = yield item
+                            except GeneratorExit:  # closed early, the step stops as it is
+                                raise
+                            except BaseException:  # thrown in by the consumer, fails the step unless the generator handles it
+                                step.resume()
+                                item = await gen.athrow(*sys.exc_info())
+                            else:
+                                step.resume()
+                                item = await gen.asend(sent)
+                    except StopAsyncIteration:
+                        pass
+            finally:
+                await gen.aclose()
+
+        return gen_impl
@@ -0,0 +1,374 @@
+"""
+Streaming of results to a long-running collector process over a local socket.
+
+A pytest session with ``--allure-collector=ADDRESS`` sends its results with :py:class:`SocketAggregator`
+to a collector, that is started as::
+
+  python -m allure.collector ADDRESS
+
+``ADDRESS`` is a path of a Unix domain socket or ``host:port`` of a TCP one.
+The collector writes results of every session to that session's ``--alluredir``, so many concurrent sessions
+on a build host go through a single process. Sessions that share a report directory share its suites and environment.
+
+Messages are pickled, so the collector must only listen where trusted sessions can connect:
+a Unix socket in a private directory or a port on localhost behind a firewall.
+
+Every message goes in a frame, that is prefixed with its length as a 4-byte big-endian integer.
+"""
+
+import os
+import sys
+import time
+import uuid
+import errno
+import pickle
+import socket
+import struct
+import argparse
+import itertools
+import threading
+
+from six.moves import socketserver
+
+from allure.aggregator import ResultAggregator
+from allure.common import AllureImpl
+from allure.durations import DurationDB
+from allure.summary import SessionSummary
+from allure.writers import writer_class
+
+
+HEADER = struct.Struct('>I')
+ACK = b'\x01'
+
+
+def parse_address(address):
+    """
+    Returns ``(family, address)`` for ``socket.socket`` from ``host:port`` or a Unix socket path
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def frame(message):
+    """
+    Returns pickled ``message`` prefixed with its length
+    """
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+
+def read_frames(stream):
+    """
+    Yields messages from binary file-like ``stream`` till it ends, a partial frame at the end is dropped
+    """
+    while True:
+        header = stream.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+
+        size, = HEADER.unpack(header)
+        data = stream.read(size)
+        if len(data) < size:
+            return
+
+        yield pickle.loads(data)
+
+
+class SocketAggregator(object):
+    """
+    Has the API of :py:class:`allure.aggregator.ResultAggregator`, but sends the calls to a collector at ``address``,
+    that builds a :py:class:`allure.aggregator.ResultAggregator` from ``kw`` (as :py:func:`allure.aggregator.make_aggregator` does).
+
+    Messages are sent in batches of ``batch`` ones. If sending fails, they are kept (at most ``buffer`` of them,
+    the oldest ones are dropped) and sent again after reconnecting with the next batch.
+    The collector knows the session by its id, so a reconnect does not start a new one.
+    A message may thus be delivered twice, that is fine as test cases are deduplicated by ids.
+
+    Finishing sends everything, retrying for ``timeout`` seconds, and waits as long for the collector to write it.
+    """
+
+    def __init__(self, address, batch=64, buffer=10000, timeout=30, **kw):
+        self.family, self.address = parse_address(address)
+        self.batch = batch
+        self.buffer = buffer
+        self.timeout = timeout
+
+        # the collector has its own working directory
+        for path in ('reportdir', 'durations_path'):
+            if kw.get(path):
+                kw[path] = os.path.abspath(kw[path])
+
+        self.start = frame(('start', str(uuid.uuid4()), kw))
+        self.pending = []  # frames to send
+        self.dropped = 0
+        self.sock = None
+
+    def add_result(self, nodeid, payload):
+        self._send(('add_result', (nodeid, payload)))
+
+    def add_suite(self, suite):
+        self._send(('add_suite', (suite,)))
+
+    def add_environment(self, environment):
+        self._send(('add_environment', (environment,)))
+
+    def finish(self):
+        self.pending.append(frame(('finish',)))
+
+        deadline = time.time() + self.timeout
+        while not self._flush():
+            if time.time() > deadline:
+                raise RuntimeError('Could not send %d messages to the allure collector at %s' % (len(self.pending) + self.dropped, self.address))
+            time.sleep(0.1)
+
+        self.sock.settimeout(self.timeout)
+        try:
+            ack = self.sock.recv(1)
+        except (IOError, OSError, socket.error):  # including a timeout
+            ack = None
+        self.close()
+
+        if ack != ACK:
+            raise RuntimeError('The allure collector at %s did not confirm results were written' % (self.address,))
+        if self.dropped:
+            raise RuntimeError('%d messages were dropped while the allure collector at %s was not available' % (self.dropped, self.address))
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _send(self, message):
+        self.pending.append(frame(message))
+        if len(self.pending) > self.buffer:
+            del self.pending[0]
+            self.dropped += 1
+
+        if len(self.pending) >= self.batch:
+            self._flush()
+
+    def _flush(self):
+        """
+        Sends pending frames, (re)connecting if needed, and returns whether it succeeded
+        """
+        try:
+            if self.sock is None:
+                sock = socket.socket(self.family, socket.SOCK_STREAM)
+                sock.connect(self.address)
+                sock.sendall(self.start)
+                self.sock = sock
+
+            self.sock.sendall(b''.join(self.pending))
+        except (IOError, OSError, socket.error):
+            self.close()
+            return False
+
+        self.pending = []
+        return True
+
+
+class Collector(object):
+    """
+    Keeps a :py:class:`allure.aggregator.ResultAggregator` for every session by its id,
+    those of sessions with the same report directory and writer share their :py:class:`allure.common.AllureImpl`.
+
+    Report directory is cleared when the first of its sessions starts.
+
+    Connections of a session are handled in the order they were accepted: a session that has reconnected
+    goes on once its earlier connections are read to the end (or after ``drain_timeout`` seconds),
+    as a payload may refer to a module, labels or a trace that an earlier one has sent (see :py:mod:`allure.payload`).
+
+    ``lock`` guards the connections and the sessions only. Calls of the sessions that share an ``AllureImpl``
+    go one at a time under the lock of that, so sessions with different reports write in parallel.
+
+    A session all of whose connections have closed without its finish message (as of a crashed client)
+    is finished after ``session_timeout`` seconds, so its report is written and closed.
+    """
+
+    def __init__(self, drain_timeout=10, session_timeout=600):
+        self.lock = threading.Condition()
+        self.drain_timeout = drain_timeout
+        self.session_timeout = session_timeout
+        self.sessions = {}  # session id => (ResultAggregator, impl key), None while it starts
+        self.impls = {}  # (report directory, writer) => [AllureImpl, number of sessions], guarded by the lock of the key
+        self.locks = {}  # (report directory, writer) => lock of the calls that go to its AllureImpl
+        self.connections = {}  # number of an open connection => its session id (None till its start message)
+        self.left = {}  # session id => time its last connection closed, while it has none
+        self.numbers = itertools.count()
+
+    def accept(self):
+        """
+        Notes a new connection and returns its number
+        """
+        with self.lock:
+            number = next(self.numbers)
+            self.connections[number] = None
+            return number
+
+    def call(self, number, message):
+        """
+        Handles ``message`` that came over the connection ``number``
+        """
+        if message[0] == 'start':
+            _, session, kw = message
+            with self.lock:
+                self.connections[number] = session
+                self.left.pop(session, None)
+                self.lock.notify_all()
+
+                deadline = time.time() + self.drain_timeout
+                while any(n < number and s in (None, session) for (n, s) in self.connections.items()) and time.time() < deadline:
+                    self.lock.wait(deadline - time.time())
+
+                new = session not in self.sessions  # not a reconnect
+                if new:
+                    self.sessions[session] = None
+
+            if new:
+                started = self.start(**kw)
+                with self.lock:
+                    self.sessions[session] = started
+        elif message[0] == 'finish':
+            self.finish(self.connections[number])
+        else:
+            method, args = message
+            with self.lock:
+                aggregator, key = self.sessions[self.connections[number]]
+                lock = self.locks[key]
+            with lock:
+                getattr(aggregator, method)(*args)
+
+    def disconnect(self, number):
+        """
+        Notes that the connection ``number`` is closed, the session it was the last one of expires if it does not come back
+        """
+        with self.lock:
+            session = self.connections.pop(number, None)
+            self.lock.notify_all()
+
+            if session in self.sessions and session not in self.connections.values():
+                left = self.left[session] = time.time()
+                timer = threading.Timer(self.session_timeout, self.expire, (session, left))
+                timer.daemon = True
+                timer.start()
+
+    def expire(self, session, left):
+        """
+        Finishes ``session`` unless it has come back since it ``left``
+        """
+        with self.lock:
+            if self.left.get(session) != left:
+                return
+        self.finish(session)
+
+    def start(self, reportdir, writer, summary_size=None, durations_path=None, dedupe_traces=False):
+        key = (os.path.abspath(reportdir), writer)
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in self.impls:
+                self.impls[key] = [AllureImpl(reportdir, writer_class(writer)(reportdir)), 0]
+            self.impls[key][1] += 1
+
+            return ResultAggregator(self.impls[key][0],
+                                    SessionSummary(summary_size) if summary_size else None,
+                                    DurationDB(durations_path) if durations_path else None,
+                                    dedupe_traces=dedupe_traces), key
+
+    def finish(self, session):
+        """
+        Writes and forgets ``session``, closes its ``AllureImpl`` if that was the last session of it
+        """
+        with self.lock:
+            if not self.sessions.get(session):  # a repeated finish message or an expired session
+                return
+            aggregator, key = self.sessions.pop(session)
+            self.left.pop(session, None)
+            lock = self.locks[key]
+
+        with lock:
+            aggregator.finish()
+
+            self.impls[key][1] -= 1
+            if not self.impls[key][1]:
+                self.impls.pop(key)[0].close()
+
+
+class CollectorHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        number = self.client_address[0]
+        try:
+            for message in read_frames(self.rfile):
+                self.server.collector.call(number, message)
+                if message[0] == 'finish':
+                    self.wfile.write(ACK)
+                    self.wfile.flush()
+        finally:
+            self.server.collector.disconnect(number)
+
+
+class CollectorServer(socketserver.ThreadingMixIn):
+    """
+    Numbers connections as they are accepted, the handler gets ``(number, address)`` as the client address
+    """
+    daemon_threads = True
+
+    def get_request(self):
+        request, address = self.socket.accept()
+        return request, (self.collector.accept(), address)
+
+
+class UnixCollectorServer(CollectorServer, socketserver.UnixStreamServer):
+    pass
+
+
+class TCPCollectorServer(CollectorServer, socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def make_server(address, **kw):
+    """
+    Returns a collector server listening at ``address``, a stale Unix socket there is removed first.
+
+    ``kw`` go to the :py:class:`Collector`.
+    """
+    family, address = parse_address(address)
+    if family == socket.AF_UNIX:
+        try:
+            os.unlink(address)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        server = UnixCollectorServer(address, CollectorHandler)
+    else:
+        server = TCPCollectorServer(address, CollectorHandler)
+
+    server.collector = Collector(**kw)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m allure.collector',
+                                     description='Collects allure results streamed by pytest sessions with --allure-collector.')
+    parser.add_argument('address', help='path of a Unix domain socket or host:port to listen at')
+    parser.add_argument('--session-timeout', type=float, default=600, metavar='SECONDS',
+                        help='finish a session that has been disconnected without finishing for that long (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    server = make_server(args.address, session_timeout=args.session_timeout)
+    sys.stdout.write('Collecting allure results at %s\n' % args.address)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,33 +4,38 @@ Created on Feb 23, 2014
 
 @author: pupssman
 """
-import os
+import sys
 import uuid
-from contextlib import contextmanager
-from distutils.version import StrictVersion
+import warnings
 from functools import wraps
 
-import py
-from _pytest import __version__ as pytest_version
-from lxml import etree
-from six import text_type, iteritems
+from six import iteritems
 
 from allure.constants import AttachmentType, Status
-from allure.structure import Attach, TestStep, TestCase, TestSuite, Failure, Environment, EnvParameter
-from allure.utils import now
+from allure.utils import now, StepTitle
 
-if StrictVersion(pytest_version) >= StrictVersion("3.2.0"):
+try:
     from _pytest.outcomes import Skipped, XFailed
-else:
+except ImportError:  # before pytest 3.2.0
     from _pytest.runner import Skipped
     from _pytest.skipping import XFailed
 
+if sys.version_info >= (3, 6):
+    from allure.aio import AsyncStepContextMixin, wrap_async
+else:
+    AsyncStepContextMixin, wrap_async = object, None
+
+
+class StepContext(AsyncStepContextMixin):
+    """
+    Context manager (also an ``async with`` one on Python 3.6+) and decorator for steps.
+    """
 
-class StepContext:
     def __init__(self, allure, title):
         self.allure = allure
         self.title = title
         self.step = None
+        self.suspended = False
 
     def __enter__(self):
         if self.allure:
@@ -39,7 +44,7 @@ class StepContext:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.allure:
-            if exc_type is not None:
+            if exc_type is not None and exc_type is not GeneratorExit:  # that one closes a generator early, it is not a failure
                 if exc_type == Skipped:
                     self.step.status = Status.CANCELED
                 elif exc_type == XFailed:
@@ -48,17 +53,52 @@ class StepContext:
                     self.step.status = Status.FAILED
             else:
                 self.step.status = Status.PASSED
-            self.allure.stop_step()
+            self.allure.stop_step(self.step if self.suspended else None)
+
+    def suspend(self):
+        """
+        Takes the step off the stack while the code it covers waits (as an async generator does at ``yield``),
+        so what runs meanwhile does not go under it. :py:meth:`resume` puts it back.
+        """
+        if self.allure:
+            self.step.status = Status.PASSED  # unless it fails after it is resumed, or the code is never resumed nor closed
+            self.allure.suspend_step()
+            self.suspended = True
+
+    def resume(self):
+        if self.allure:
+            self.allure.resume_step(self.step)
+            self.suspended = False
 
     def __call__(self, func):
         """
         Pretend that we are a decorator -- wrap the ``func`` with self.
         FIXME: may fail if evil dude will try to reuse ``pytest.allure.step`` instance.
+
+        Coroutine functions and async generator functions are wrapped so the step covers their execution.
         """
 
+        template = self.title
+        has_fields = '{' in template or '}' in template
+
+        if wrap_async is not None:
+            def context(a, kw):
+                allure = self.allure
+                if allure:
+                    return StepContext(allure, StepTitle(template, a, kw) if has_fields else template)
+
+            async_impl = wrap_async(func, context)
+            if async_impl is not None:
+                return async_impl
+
         @wraps(func)
         def impl(*a, **kw):
-            with StepContext(self.allure, self.title.format(*a, **kw)):
+            allure = self.allure
+            if not allure:
+                # nothing records the step, so neither format the title nor enter the context
+                return func(*a, **kw)
+
+            with StepContext(allure, StepTitle(template, a, kw) if has_fields else template):
                 return func(*a, **kw)
 
         return impl
@@ -92,18 +132,14 @@ class AllureImpl(object):
 
     """
 
-    def __init__(self, logdir):
-        self.logdir = os.path.normpath(
-            os.path.abspath(os.path.expanduser(os.path.expandvars(logdir))))
+    def __init__(self, logdir, writer=None):
+        """
+        :arg logdir: report directory, that is cleared
+        :arg writer: a :py:class:`allure.writers.Writer` to write to instead of the ``logdir``
+        """
+        from allure.writers import XMLDirectoryWriter
 
-        # Delete all files in report directory
-        if not os.path.exists(self.logdir):
-            os.makedirs(self.logdir)
-        else:
-            for f in os.listdir(self.logdir):
-                f = os.path.join(self.logdir, f)
-                if os.path.isfile(f):
-                    os.unlink(f)
+        self.writer = writer or XMLDirectoryWriter(logdir)
 
         # That's the state stack. It can contain TestCases or TestSteps.
         # Attaches and steps go to the object at top of the stack.
@@ -116,6 +152,8 @@ class AllureImpl(object):
         """
         Attaches ``contents`` with ``title`` and ``attach_type`` to the current active thing
         """
+        from allure.structure import Attach
+
         attach = Attach(
             source=self._save_attach(contents, attach_type=attach_type),
             title=title,
@@ -127,23 +165,41 @@ class AllureImpl(object):
         Starts an new :py:class:`allure.structure.TestStep` with given ``name``,
         pushes it to the ``self.stack`` and returns the step.
         """
+        from allure.structure import TestStep
+
         step = TestStep(
             name=name, title=name, start=now(), attachments=[], steps=[])
         self.stack[-1].steps.append(step)
         self.stack.append(step)
         return step
 
-    def stop_step(self):
+    def stop_step(self, step=None):
+        """
+        Stops the step at the top of ``self.stack`` or a ``step`` that is suspended (then it stops when it was suspended)
+        """
+        if step is None:
+            step = self.stack.pop()
+            step.stop = now()
+
+    def suspend_step(self):
         """
-        Stops the step at the top of ``self.stack``
+        Takes the step at the top of ``self.stack`` off it without stopping, to be resumed or stopped later
         """
         step = self.stack.pop()
         step.stop = now()
 
+    def resume_step(self, step):
+        """
+        Puts a suspended ``step`` back to the top of ``self.stack``
+        """
+        self.stack.append(step)
+
     def start_case(self, name, description=None, labels=None):
         """
         Starts a new :py:class:`allure.structure.TestCase`
         """
+        from allure.structure import TestCase
+
         test = TestCase(
             name=name,
             description=description,
@@ -168,6 +224,8 @@ class AllureImpl(object):
         test.stop = now()
 
         if message or trace:
+            from allure.structure import Failure
+
             test.failure = Failure(message=message, trace=trace or '')
 
         self.testsuite.tests.append(test)
@@ -178,6 +236,8 @@ class AllureImpl(object):
         """
         Starts a new Suite with given ``name`` and ``description``
         """
+        from allure.structure import TestSuite
+
         self.testsuite = TestSuite(
             name=name,
             title=title,
@@ -192,13 +252,14 @@ class AllureImpl(object):
         """
         self.testsuite.stop = now()
 
-        with self._reportfile('%s-testsuite.xml' % uuid.uuid4()) as f:
-            self._write_xml(f, self.testsuite)
+        self.writer.write_suite(self.testsuite)
 
     def store_environment(self):
         if not self.environment:
             return
 
+        from allure.structure import Environment, EnvParameter
+
         environment = Environment(
             id=uuid.uuid4(),
             name="Allure environment parameters",
@@ -207,8 +268,20 @@ class AllureImpl(object):
             environment.parameters.append(
                 EnvParameter(name=key, key=key, value=value))
 
-        with self._reportfile('environment.xml') as f:
-            self._write_xml(f, environment)
+        self.writer.write_environment(environment)
+
+    def close(self):
+        """
+        Tells the writer that everything is written
+        """
+        self.writer.close()
+
+    @property
+    def logdir(self):
+        """
+        Report directory of the writer, ``None`` if the writer writes elsewhere
+        """
+        return getattr(self.writer, 'logdir', None)
 
     def _save_attach(self, body, attach_type=AttachmentType.TEXT):
         """
@@ -216,43 +289,27 @@ class AllureImpl(object):
 
         :arg body: str or unicode with contents. str is written as-is in byte stream, unicode is written as utf-8 (what do you expect else?)
         """
-        with self._attachfile("%s-attachment.%s" %
-                              (uuid.uuid4(), attach_type.extension)) as f:
-            if isinstance(body, text_type):
-                f.write(body.encode('utf-8'))
-            else:
-                f.write(body)
-            return os.path.basename(f.name)
+        return self.writer.write_attachment(body, attach_type)
 
-    @contextmanager
     def _attachfile(self, filename):
         """
-        Yields open file object in the report directory with given name
+        Deprecated, attachments are written by ``self.writer``
         """
-        reportpath = os.path.join(self.logdir, filename)
-
-        with open(reportpath, 'wb') as f:
-            yield f
+        warnings.warn('AllureImpl._attachfile is deprecated, use AllureImpl.writer.write_attachment', DeprecationWarning)
+        return self.writer._attachfile(filename)
 
-    @contextmanager
     def _reportfile(self, filename):
         """
-        Yields open file object in the report directory with given name
+        Deprecated, report files are written by ``self.writer``
         """
-        reportpath = os.path.join(self.logdir, filename)
-        encoding = 'utf-8'
-
-        logfile = py.std.codecs.open(reportpath, 'w', encoding=encoding)
-
-        try:
-            yield logfile
-        finally:
-            logfile.close()
+        warnings.warn('AllureImpl._reportfile is deprecated, use AllureImpl.writer.write_file', DeprecationWarning)
+        return self.writer._reportfile(filename)
 
     def _write_xml(self, logfile, xmlfied):
-        logfile.write(
-            etree.tostring(
-                xmlfied.toxml(),
-                pretty_print=True,
-                xml_declaration=False,
-                encoding=text_type))
+        """
+        Deprecated, report files are written by ``self.writer``
+        """
+        from allure.writers import Writer
+
+        warnings.warn('AllureImpl._write_xml is deprecated, use AllureImpl.writer', DeprecationWarning)
+        logfile.write(Writer.to_xml(xmlfied))
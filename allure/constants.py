@@ -27,6 +27,7 @@ class Label(object):
     HOST = 'host'
     FRAMEWORK = 'framework'
     LANGUAGE = 'language'
+    DURATION_US = 'duration_us'
 
 
 class Severity(object):
@@ -56,3 +57,5 @@ ALLURE_NAMESPACE = "urn:model.allure.qatools.yandex.ru"
 COMMON_NAMESPACE = "urn:model.commons.qatools.yandex.ru"
 FAILED_STATUSES = [Status.FAILED, Status.BROKEN]
 SKIPPED_STATUSES = [Status.CANCELED, Status.PENDING]
+# from the least to the most severe, used to sum up several statuses into one
+STATUS_PRIORITY = [Status.PASSED, Status.CANCELED, Status.PENDING, Status.BROKEN, Status.FAILED]
@@ -0,0 +1,119 @@
+"""
+Test durations recorded by previous runs, to order and split tests by their expected time.
+
+Tests are ordered by a :py:class:`DurationDB`, that every run updates, and split into shards by :py:class:`ResultDurations`
+of allure results of a previous run, so every machine splits them the same way.
+"""
+
+import io
+import heapq
+import os
+import json
+
+
+def default_path(reportdir):
+    """
+    Returns path of the duration database beside the ``reportdir``, as that one is purged on every run
+    """
+    return os.path.abspath(reportdir).rstrip(os.sep) + '.durations.json'
+
+
+class DurationDB(object):
+    """
+    Durations of tests (in milliseconds) by their nodeids, as recorded by the last run that had them.
+
+    Is stored as a flat JSON object at ``path``, tests that are not run keep their old durations.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with io.open(path, encoding='utf-8') as f:
+                self.durations = json.load(f)
+        except (IOError, OSError, ValueError):  # no history yet or it is broken
+            self.durations = {}
+
+        # estimate for the tests that have no history
+        self.default = sum(self.durations.values()) / len(self.durations) if self.durations else 0.0
+
+    def estimate(self, nodeid):
+        """
+        Returns expected duration of test ``nodeid``
+        """
+        return self.durations.get(nodeid, self.default)
+
+    def record(self, nodeid, duration):
+        self.durations[nodeid] = round(duration, 1)
+
+    def save(self):
+        """
+        Writes the database to a temporary file and then moves it to ``path``, so readers never see a partial one
+        """
+        temp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump(self.durations, f, separators=(',', ':'), sort_keys=True)
+        getattr(os, 'replace', os.rename)(temp, self.path)
+
+
+class ResultDurations(object):
+    """
+    Durations of tests (in milliseconds) by ``(module name, case name)``, as ``durations`` dict of those.
+
+    Has the ``estimate`` of :py:class:`DurationDB`, tests that are not there are expected to take the average time.
+    """
+
+    def __init__(self, durations):
+        self.durations = durations
+        self.default = sum(self.durations.values()) / float(len(self.durations)) if self.durations else 0.0
+
+    @classmethod
+    def read(cls, directory):
+        """
+        Reads durations of test cases in allure results at ``directory``,
+        e.g. results of all the shards of a previous run merged with ``python -m allure.merge``
+        """
+        from allure.reader import read_results  # lxml is only needed here
+
+        return cls(dict(((suite.name, case.name), case.stop - case.start) for (suite, case) in read_results(directory)
+                        if case.start is not None and case.stop is not None))
+
+    def estimate(self, key):
+        """
+        Returns expected duration of the test ``(module name, case name)``
+        """
+        return self.durations.get(key, self.default)
+
+
+def nodeid(item):
+    return item.nodeid
+
+
+def longest_first(items, db, key=nodeid):
+    """
+    Returns ``items`` ordered by their expected durations, longest first.
+    ``key`` returns what ``db`` knows an item by.
+
+    Equally long items keep their order, so every xdist node gets the same order from the same database.
+    """
+    return sorted(items, key=lambda item: -db.estimate(key(item)))
+
+
+def shard(items, db, index, count, key=nodeid):
+    """
+    Splits ``items`` into ``count`` shards of about equal expected duration
+    and returns ``(selected, deselected)`` items for the shard ``index`` (from 0), both in the original order.
+    ``key`` returns what ``db`` knows an item by.
+
+    Items go longest first to the shard that is expected to take least time so far (the first of equal ones),
+    so every machine computes the same split from the same durations.
+    Every item is expected to take at least a millisecond, so items without history are spread evenly.
+    """
+    loads = [(0.0, n) for n in range(count)]
+    chosen = set()
+    for item in longest_first(items, db, key):
+        load, n = heapq.heappop(loads)
+        if n == index:
+            chosen.add(id(item))
+        heapq.heappush(loads, (load + max(db.estimate(key(item)), 1.0), n))
+
+    return [i for i in items if id(i) in chosen], [i for i in items if id(i) not in chosen]
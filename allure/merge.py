@@ -0,0 +1,173 @@
+"""
+Merges allure results of several runs (e.g. of shards on many machines) into a single results directory.
+
+Suites of the same name are merged into one, of the cases with the same name the one that stopped last is kept.
+Attachments of the kept cases are hard-linked (or copied, or moved) to the output directory.
+Many suites may share an attachment, so those to move are linked by the merging processes
+and their sources are removed once all the suites are merged.
+
+Only one merged suite is held in memory by a process at a time, suites are merged in parallel processes::
+
+  python -m allure.merge OUT IN [IN ...]
+"""
+
+import os
+import sys
+import uuid
+import shutil
+import argparse
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+
+from lxml import etree
+from six import text_type, iteritems
+
+from allure.reader import suite_files, suite_name
+from allure.structure import Environment, EnvParameter
+
+
+def read_suite(path):
+    """
+    Returns the suite element of the file at ``path`` without its test cases and a list of those test case elements
+    """
+    cases = []
+    depth = 0
+    for event, elem in etree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            continue
+
+        depth -= 1
+        if elem.tag == 'test-case' and depth == 2:
+            elem.getparent().remove(elem)
+            cases.append(elem)
+
+    return elem, cases  # the last element to end is the suite itself
+
+
+def transfer(source, destination):
+    """
+    Hard-links (or copies, if that is not possible) file ``source`` to ``destination`` unless that one exists
+    """
+    if os.path.exists(destination):
+        return
+    try:
+        os.link(source, destination)
+    except (OSError, AttributeError):  # other file system, no hard links at all or linked by another process just now
+        if not os.path.exists(destination):
+            shutil.copy2(source, destination)
+
+
+def merge_suite(task):
+    """
+    Merges suite files ``paths`` into a single suite file in directory ``out``.
+
+    ``task`` is an ``(out, paths, move)`` tuple, so that is callable via :py:meth:`multiprocessing.Pool.imap`.
+
+    Returns number of cases in the merged suite and, if attachments are to be ``move``-d,
+    a list of their sources to remove.
+    """
+    out, paths, move = task
+
+    suite = None
+    cases = OrderedDict()  # name => (test case element, directory of its attachments)
+    for path in paths:
+        root, found = read_suite(path)
+        if suite is None:
+            suite = root
+        else:
+            suite.set('start', text_type(min(int(suite.get('start')), int(root.get('start')))))
+            suite.set('stop', text_type(max(int(suite.get('stop')), int(root.get('stop')))))
+
+        for case in found:
+            name = case.findtext('name')
+            if name not in cases or int(case.get('stop', 0)) >= int(cases[name][0].get('stop', 0)):
+                cases[name] = (case, os.path.dirname(path))
+
+    test_cases = suite.find('test-cases')
+    if test_cases is None:
+        test_cases = etree.SubElement(suite, 'test-cases')
+
+    moved = []
+    for case, directory in cases.values():
+        test_cases.append(case)
+        for attachment in case.iter('attachment'):
+            source, destination = os.path.join(directory, attachment.get('source')), os.path.join(out, attachment.get('source'))
+            transfer(source, destination)
+            if move and os.path.abspath(source) != os.path.abspath(destination):
+                moved.append(source)
+
+    etree.ElementTree(suite).write(os.path.join(out, '%s-testsuite.xml' % uuid.uuid4()), encoding='utf-8', pretty_print=True)
+
+    return len(cases), moved
+
+
+def merge_environments(out, directories):
+    """
+    Merges ``environment.xml`` files of ``directories`` into one in ``out``, later directories override parameters
+    """
+    parameters = OrderedDict()
+    for directory in directories:
+        path = os.path.join(directory, 'environment.xml')
+        if os.path.exists(path):
+            for parameter in etree.parse(path).getroot().iter('parameter'):
+                parameters[parameter.findtext('key')] = parameter.findtext('value')
+
+    if parameters:
+        environment = Environment(id=uuid.uuid4(),
+                                  name="Allure environment parameters",
+                                  parameters=[EnvParameter(name=key, key=key, value=value) for (key, value) in iteritems(parameters)])
+        etree.ElementTree(environment.toxml()).write(os.path.join(out, 'environment.xml'), encoding='utf-8', pretty_print=True)
+
+
+def merge(out, directories, jobs=None, move=False):
+    """
+    Merges allure results of ``directories`` into ``out`` in ``jobs`` processes (one per CPU by default).
+
+    Returns number of cases in the merged results.
+    """
+    if not os.path.exists(out):
+        os.makedirs(out)
+
+    paths = [path for directory in directories for path in suite_files(directory)]
+
+    pool = Pool(jobs or cpu_count()) if jobs != 1 else None
+    imap = pool.imap if pool else map
+
+    groups = OrderedDict()
+    for path, name in zip(paths, imap(suite_name, paths)):
+        groups.setdefault(name, []).append(path)
+
+    count = 0
+    moved = set()  # sources shared by suites are there once
+    try:
+        for merged, sources in imap(merge_suite, [(out, group, move) for group in groups.values()]):
+            count += merged
+            moved.update(sources)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    for source in moved:
+        os.remove(source)
+
+    merge_environments(out, directories)
+
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m allure.merge', description='Merges allure results of several runs into one directory.')
+    parser.add_argument('out', help='directory to write merged results to')
+    parser.add_argument('inputs', nargs='+', metavar='in', help='directory with results to merge')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes to merge in, one per CPU by default')
+    parser.add_argument('--move', action='store_true', help='move attachments instead of hard-linking them')
+    args = parser.parse_args(argv)
+
+    count = merge(args.out, args.inputs, args.jobs, args.move)
+    sys.stdout.write('Merged %d test cases into %s\n' % (count, args.out))
+
+
+if __name__ == '__main__':
+    main()
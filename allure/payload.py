@@ -0,0 +1,148 @@
+"""
+Encoding of test results that go from :py:class:`allure.pytest_plugin.AllureTestListener`
+to a :py:class:`allure.aggregator.ResultAggregator` (over the xdist channel, if it runs on a node).
+
+A payload is a pickled five-tuple: (encoder ID, module, environment, trace, TestCase).
+
+Module is sent as ``(number, module ID, module name, module doc)`` the first time and as a ``number`` then,
+environment is a dict of the entries that changed since the previous payload of the encoder (``None`` if nothing did).
+Text trace of the failure is taken off the TestCase and sent as ``(hash, trace)`` the first time and as a ``hash`` then,
+as many tests often fail the same way (``None`` if there is no such trace).
+
+Interned labels (see :py:meth:`allure.structure.TestLabel.interned`) are pickled as persistent IDs
+the same way: ``(encoder ID, number, name, value)`` the first time and ``(encoder ID, number)`` then,
+and are unpickled as interned ones.
+
+So payloads of an encoder must be decoded in the order they were encoded, by a single decoder.
+"""
+
+import os
+import io
+import uuid
+import pickle
+
+from six import text_type
+
+from allure.structure import TestLabel, Failure
+from allure.utils import uid
+
+
+class LabelPickler(pickle.Pickler):
+
+    def __init__(self, stream, encoder):
+        pickle.Pickler.__init__(self, stream, pickle.HIGHEST_PROTOCOL)
+        self.encoder = encoder
+
+    def persistent_id(self, obj):
+        if type(obj) is TestLabel and obj.is_interned():
+            return self.encoder.label_id(obj)
+
+
+class LabelUnpickler(pickle.Unpickler):
+
+    def __init__(self, stream, decoder):
+        pickle.Unpickler.__init__(self, stream)
+        self.decoder = decoder
+
+    def persistent_load(self, pid):
+        return self.decoder.label(pid)
+
+
+class PayloadEncoder(object):
+    """
+    Encodes results of a single process, knows which modules, labels and environment it has already sent
+    """
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.modules = {}  # module ID => number
+        self.labels = {}  # (name, value) => number
+        self.traces = set()  # hashes of sent traces
+        self.environment = {}  # as sent so far
+
+    def encode(self, module_id, module_name, module_doc, environment, testcase):
+        number = self.modules.get(module_id)
+        if number is None:
+            number = self.modules[module_id] = len(self.modules)
+            module = (number, module_id, module_name, module_doc)
+        else:
+            module = number
+
+        changed = dict((key, value) for (key, value) in environment.items()
+                       if key not in self.environment or self.environment[key] != value)
+        self.environment.update(changed)
+
+        failure = testcase.failure
+        if failure is not None and failure.trace and isinstance(failure.trace, text_type):
+            key = uid(failure.trace.encode('utf-8'))
+            trace = key if key in self.traces else (key, failure.trace)
+            self.traces.add(key)
+            testcase.failure = Failure(message=failure.message, trace=None)
+        else:
+            trace = None
+
+        stream = io.BytesIO()
+        try:
+            LabelPickler(stream, self).dump((self.id, module, changed or None, trace, testcase))
+        finally:
+            testcase.failure = failure
+        return stream.getvalue()
+
+    def label_id(self, label):
+        key = (label.name, label.value)
+        number = self.labels.get(key)
+        if number is None:
+            number = self.labels[key] = len(self.labels)
+            return (self.id, number, label.name, label.value)
+        return (self.id, number)
+
+
+class PayloadDecoder(object):
+    """
+    Decodes payloads of any number of encoders
+    """
+
+    def __init__(self):
+        self.modules = {}  # (encoder ID, number) => (module ID, module name, module doc)
+        self.labels = {}  # (encoder ID, number) => TestLabel
+        self.traces = {}  # hash => trace
+
+    def decode(self, nodeid, payload):
+        """
+        Returns a five-tuple: (test module ID, test module name, test module doc, changed environment, TestCase)
+        of the payload of test ``nodeid``.
+
+        If the payload that has sent the module is lost (as it happens with an overflowing
+        :py:class:`allure.collector.SocketAggregator`), the module is made up from ``nodeid``.
+        """
+        source, module, environment, trace, testcase = LabelUnpickler(io.BytesIO(payload), self).load()
+
+        if isinstance(module, tuple):
+            number, module_id, module_name, module_doc = module
+            self.modules[(source, number)] = (module_id, module_name, module_doc)
+        else:
+            module_id, module_name, module_doc = self.modules.get((source, module)) or self._made_up(nodeid)
+
+        if isinstance(trace, tuple):
+            self.traces[trace[0]] = testcase.failure.trace = trace[1]
+        elif trace is not None:
+            testcase.failure.trace = self.traces.get(trace, u'The trace is lost')
+
+        return module_id, module_name, module_doc, environment or {}, testcase
+
+    def label(self, pid):
+        """
+        Returns the interned label by its persistent ID
+        """
+        if len(pid) == 4:
+            source, number, name, value = pid
+            self.labels[(source, number)] = TestLabel.interned(name, value)
+        label = self.labels.get(pid[:2])
+        if label is None:  # lost with its first payload, so it can not be restored
+            label = TestLabel(name='unknown', value='unknown')
+        return label
+
+    @staticmethod
+    def _made_up(nodeid):
+        module_id = nodeid.split('::')[0]
+        return module_id, os.path.splitext(module_id)[0].replace('/', '.'), ''
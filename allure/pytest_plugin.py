@@ -1,17 +1,29 @@
+import os
+import sys
 import uuid
-import pickle
 import pytest
 import argparse
+import threading
 
 from collections import namedtuple
-from six import text_type
+from functools import partial
+from six import text_type, reraise
 
-from allure.common import AllureImpl, StepContext
+try:
+    from contextvars import ContextVar
+except ImportError:  # before python 3.7
+    ContextVar = None
+
+from allure.common import AllureImpl, StepContext, Skipped
 from allure.constants import Status, AttachmentType, Severity, \
-    FAILED_STATUSES, Label, SKIPPED_STATUSES
-from allure.utils import parent_module, parent_down_from_module, labels_of, \
-    all_of, get_exception_message, now, mangle_testnames
-from allure.structure import TestCase, TestStep, Attach, TestSuite, Failure, TestLabel
+    FAILED_STATUSES, Label, SKIPPED_STATUSES, STATUS_PRIORITY
+from allure.utils import parent_module, labels_of, \
+    all_of, get_exception_message, now, case_name, collector_name, unicodify, elide
+
+# the rest (aggregators, collector, payloads, durations) is imported when a session is configured to report
+
+
+CONFIGURING = object()  # stands for the listener of a session that is not configured yet, see AllureHelper._sessions
 
 
 def pytest_addoption(parser):
@@ -22,6 +34,137 @@ def pytest_addoption(parser):
                                            default=None,
                                            help="Generate Allure report in the specified directory (may not exist)")
 
+    parser.getgroup("reporting").addoption('--allure-writer',
+                                           action="store",
+                                           dest="allurewriter",
+                                           metavar="WRITER",
+                                           default='xml',
+                                           help="Write the report with WRITER: one of json, memory, xml, zip or module:Class "
+                                                "of a custom allure.writers.Writer, that gets --alluredir value")
+
+    parser.getgroup("reporting").addoption('--allure-writer-process',
+                                           action="store_true",
+                                           dest="allurewriterprocess",
+                                           default=False,
+                                           help="Build and write the report in a separate process, so it does not slow down the tests")
+
+    parser.getgroup("reporting").addoption('--allure-collector',
+                                           action="store",
+                                           dest="allurecollector",
+                                           metavar="ADDRESS",
+                                           default=None,
+                                           help="Send results to the collector (see python -m allure.collector) listening at ADDRESS, "
+                                                "a Unix socket path or host:port, it writes the report instead of this session")
+
+    parser.getgroup("reporting").addoption('--allure-worker-suites',
+                                           action="store_true",
+                                           dest="allureworkersuites",
+                                           default=False,
+                                           help="Let each xdist node write suites of its own tests, so a module may be split into several suites; "
+                                                "summary.json and the duration database are not kept then")
+
+    parser.getgroup("reporting").addoption('--allure-capture',
+                                           action="store",
+                                           dest="allurecapture",
+                                           default='always',
+                                           choices=['always', 'failed', 'never'],
+                                           help="Attach captured output of tests always (the default), only of failed and broken ones or never")
+
+    parser.getgroup("reporting").addoption('--allure-capture-limit',
+                                           action="store",
+                                           dest="allurecapturelimit",
+                                           metavar="BYTES",
+                                           default=None,
+                                           type=int,
+                                           help="Keep at most BYTES of each attached captured output, its head and tail")
+
+    parser.getgroup("reporting").addoption('--allure-trace-limit',
+                                           action="store",
+                                           dest="alluretracelimit",
+                                           metavar="BYTES",
+                                           default=None,
+                                           type=int,
+                                           help="Keep at most BYTES of each failure trace, its head and tail")
+
+    parser.getgroup("reporting").addoption('--allure-dedupe-traces',
+                                           action="store_true",
+                                           dest="allurededupetraces",
+                                           default=False,
+                                           help="Write traces of failed tests as attachments, once for all the same ones, "
+                                                "and mark failure messages with short signatures of their traces")
+
+    parser.getgroup("reporting").addoption('--allure-collection-times',
+                                           action="store_true",
+                                           dest="allurecollectiontimes",
+                                           default=False,
+                                           help="Time collection of every test module and report it in the collection phase suite, "
+                                                "with the modules that it imports first")
+
+    parser.getgroup("reporting").addoption('--allure-collapse-steps',
+                                           action="store_true",
+                                           dest="allurecollapsesteps",
+                                           default=False,
+                                           help="Merge consecutive sibling steps with the same title and status into a single step")
+
+    parser.getgroup("reporting").addoption('--allure-max-sibling-steps',
+                                           action="store",
+                                           dest="alluremaxsiblingsteps",
+                                           metavar="COUNT",
+                                           default=None,
+                                           type=int,
+                                           help="Record at most COUNT steps per test or step, the rest are only counted in a summary step")
+
+    parser.getgroup("reporting").addoption('--allure-max-steps',
+                                           action="store",
+                                           dest="alluremaxsteps",
+                                           metavar="COUNT",
+                                           default=None,
+                                           type=int,
+                                           help="Record at most COUNT steps per test, the rest are only counted in a summary step")
+
+    parser.getgroup("reporting").addoption('--allure-max-step-depth',
+                                           action="store",
+                                           dest="alluremaxstepdepth",
+                                           metavar="DEPTH",
+                                           default=None,
+                                           type=int,
+                                           help="Do not record steps nested deeper than DEPTH, only count them in a summary step")
+
+    parser.getgroup("reporting").addoption('--allure-precise-durations',
+                                           action="store_true",
+                                           dest="allureprecisedurations",
+                                           default=False,
+                                           help="Add a label with test duration in microseconds to each test")
+
+    parser.getgroup("reporting").addoption('--allure-summary',
+                                           action="store",
+                                           dest="alluresummary",
+                                           metavar="N",
+                                           default=None,
+                                           type=int,
+                                           help="Write summary.json with N slowest tests and steps and duration percentiles per module, feature and story")
+
+    parser.getgroup("reporting").addoption('--allure-fixture-steps',
+                                           action="store_true",
+                                           dest="allurefixturesteps",
+                                           default=False,
+                                           help="Record fixture setups and teardowns as steps of the test that triggers them "
+                                                "and write their cost per scope to summary.json")
+
+    parser.getgroup("reporting").addoption('--allure-duration-db',
+                                           action="store",
+                                           dest="alluredurationdb",
+                                           metavar="PATH",
+                                           default=None,
+                                           help="Keep durations of tests in the JSON file at PATH "
+                                                "(by default, beside the report directory when --allure-longest-first is given)")
+
+    parser.getgroup("reporting").addoption('--allure-longest-first',
+                                           action="store_true",
+                                           dest="allurelongestfirst",
+                                           default=False,
+                                           help="Run tests that took longest in previous runs first, so xdist nodes finish at about the same time")
+
     severities = [v for (_, v) in all_of(Severity)]
 
     def label_type(name, legal_values=set()):
@@ -41,6 +184,43 @@ def pytest_addoption(parser):
 
         return a_label_type
 
+    def shard_type(string):
+        """
+        argparse-type for shards given as ``I/N``, that is I-th of N (counting from 1).
+        processed value is a tuple (I - 1, N).
+        """
+        try:
+            index, count = [int(x) for x in string.split('/')]
+        except ValueError:
+            raise argparse.ArgumentTypeError('Shard should be given as I/N, not {}'.format(string))
+        if not 1 <= index <= count:
+            raise argparse.ArgumentTypeError('Shard {} is not one of 1/{} to {}/{}'.format(string, count, count, count))
+
+        return index - 1, count
+
+    parser.getgroup("reporting").addoption('--allure-shard',
+                                           action="store",
+                                           dest="allureshard",
+                                           metavar="I/N",
+                                           default=None,
+                                           type=shard_type,
+                                           help="Run only I-th of N shards of tests, split to take about equal time by durations in --allure-shard-from")
+
+    parser.getgroup("reporting").addoption('--allure-shard-from',
+                                           action="store",
+                                           dest="allureshardfrom",
+                                           metavar="DIR",
+                                           default=None,
+                                           help="Allure results of a previous run (of all its shards merged) to split tests into shards by, "
+                                                "every machine should get the same ones. May be the --alluredir, those are read before it is cleared")
+
+    parser.getgroup("reporting").addoption('--allure-rerun-from',
+                                           action="store",
+                                           dest="allurererunfrom",
+                                           metavar="DIR",
+                                           default=None,
+                                           help="Run only tests that failed or broke in allure results at DIR, may be the same as --alluredir")
+
     parser.getgroup("general").addoption('--allure_severities',
                                          action="store",
                                          dest="allureseverities",
@@ -73,17 +253,159 @@ def pytest_addoption(parser):
 def pytest_configure(config):
     reportdir = config.option.allurereportdir
 
+    if config.option.allureshard and not reportdir:
+        raise pytest.UsageError('--allure-shard needs --alluredir to record results for the split of the next run')
+    if config.option.allureshard and not config.option.allureshardfrom:
+        raise pytest.UsageError('--allure-shard needs --allure-shard-from with results of a previous run, '
+                                'so every machine splits tests by the same durations')
+
+    rerun_from = config.option.allurererunfrom
+    if rerun_from:
+        from allure.reader import failed_tests
+
+        # read before the report directory is cleared, xdist nodes get the tests from the master
+        if hasattr(config, 'slaveinput'):
+            rerun = set(tuple(test) for test in config.slaveinput['allure_rerun'])
+        elif os.path.isdir(rerun_from):
+            rerun = failed_tests(rerun_from)
+        else:
+            raise pytest.UsageError('--allure-rerun-from directory %s does not exist' % rerun_from)
+
+        config.pluginmanager.register(AllureRerunListener(rerun, config))
+        if not hasattr(config, 'slaveinput') and config.pluginmanager.hasplugin('xdist'):
+            config.pluginmanager.register(AllureRerunNodeListener(rerun))
+
     if reportdir:  # we actually record something
-        allure_impl = AllureImpl(reportdir)
+        from allure.aggregator import ResultAggregator, make_aggregator, ProcessAggregator
+        from allure.collector import SocketAggregator
+        from allure.durations import DurationDB, ResultDurations, default_path
+        from allure.structure import TestLabel
+        from allure.summary import SessionSummary
+        from allure.writers import XMLDirectoryWriter, writer_class
 
         testlistener = AllureTestListener(config)
         pytest.allure._allurelistener = testlistener
         config.pluginmanager.register(testlistener)
 
-        if not hasattr(config, 'slaveinput'):
+        if config.option.allurefixturesteps:
+            config.pluginmanager.register(AllureFixtureListener(testlistener))
+
+        if config.option.alluredurationdb or config.option.allurelongestfirst:
+            durations_path = config.option.alluredurationdb or default_path(reportdir)
+        else:
+            durations_path = None
+
+        if config.option.allureshard:
+            # read before the report directory is cleared, xdist nodes get the durations from the master
+            shard_from = config.option.allureshardfrom
+            if hasattr(config, 'slaveinput'):
+                shard_durations = ResultDurations(dict(((module, case), duration)
+                                                       for (module, case, duration) in config.slaveinput['allure_shard_durations']))
+            elif os.path.isdir(shard_from):
+                shard_durations = ResultDurations.read(shard_from)
+            else:  # the first run, tests are split evenly
+                shard_durations = ResultDurations({})
+
+            if not hasattr(config, 'slaveinput') and config.pluginmanager.hasplugin('xdist'):
+                config.pluginmanager.register(AllureShardNodeListener(shard_durations))
+        else:
+            shard_durations = None
+
+        if config.option.allurelongestfirst or config.option.allureshard:
+            config.pluginmanager.register(AllureSchedulingListener(DurationDB(durations_path) if durations_path else None,
+                                                                   shard_durations, config))
+
+        worker_suites = config.option.allureworkersuites
+
+        if hasattr(config, 'slaveinput'):
+            if worker_suites:
+                # the master has already cleared the directory, so do not do that again
+                writer = writer_class(config.option.allurewriter)(reportdir, clean=False)
+                writer.tag = config.slaveinput['slaveid']
+                aggregator = ResultAggregator(AllureImpl(reportdir, writer),
+                                              labels=[TestLabel(name=Label.THREAD, value=writer.tag)],
+                                              store_environment=False,
+                                              dedupe_traces=config.option.allurededupetraces)
+
+                config.pluginmanager.register(AllureAgregatingListener(aggregator))
+                config.pluginmanager.register(AllureWorkerListener(testlistener, config))
+
+            if config.option.allurecollectiontimes:
+                # xdist nodes collect the tests, so they time it for the master
+                config.pluginmanager.register(AllureCollectionTimer(config))
+        else:
             # on xdist-master node do all the important stuff
-            config.pluginmanager.register(AllureAgregatingListener(allure_impl, config))
-            config.pluginmanager.register(AllureCollectionListener(allure_impl))
+            try:
+                writer = writer_class(config.option.allurewriter)
+            except ValueError as e:
+                raise pytest.UsageError(str(e))
+
+            if worker_suites and not issubclass(writer, XMLDirectoryWriter):
+                raise pytest.UsageError('--allure-worker-suites needs a writer to a directory, not %s' % config.option.allurewriter)
+
+            summary_size = config.option.alluresummary
+            if not summary_size and config.option.allurefixturesteps:
+                summary_size = SessionSummary.DEFAULT_SIZE
+
+            # xdist nodes write suites themselves only if there are any
+            worker_suites = worker_suites and config.pluginmanager.hasplugin('xdist') and config.getoption('dist') != 'no'
+            if worker_suites:
+                if config.option.allurecollector or config.option.allurewriterprocess:
+                    raise pytest.UsageError('--allure-worker-suites writes the report on xdist nodes, '
+                                            'it does not go with --allure-collector or --allure-writer-process')
+                # cases do not come here, so there is nothing to summarize or to time
+                summary_size = durations_path = None
+
+            if config.option.allurecollector:
+                make = partial(SocketAggregator, config.option.allurecollector)
+            elif config.option.allurewriterprocess:
+                make = ProcessAggregator
+            else:
+                make = make_aggregator
+            aggregator = make(reportdir=reportdir,
+                              writer=config.option.allurewriter,
+                              summary_size=summary_size,
+                              durations_path=durations_path,
+                              dedupe_traces=config.option.allurededupetraces)
+
+            if config.option.allurecollectiontimes:
+                timer = AllureCollectionTimer(config)
+                config.pluginmanager.register(timer)
+                if config.pluginmanager.hasplugin('xdist'):
+                    config.pluginmanager.register(AllureCollectionNodeListener(timer))
+            else:
+                timer = None
+
+            config.pluginmanager.register(AllureAgregatingListener(aggregator))
+            config.pluginmanager.register(AllureCollectionListener(aggregator, timer))
+            if worker_suites:
+                config.pluginmanager.register(AllureWorkerSuitesListener(aggregator))
+    else:
+        testlistener = None
+
+    sessions = pytest.allure._sessions
+    if sessions and sessions[-1][0] is config:
+        sessions[-1][1] = testlistener
+    else:
+        sessions.append([config, testlistener])
+
+
+@pytest.mark.tryfirst
+def pytest_load_initial_conftests(early_config):
+    """
+    Marks the session as being configured, so steps decorated in its conftests are not resolved too early.
+    """
+    pytest.allure._sessions.append([early_config, CONFIGURING])
+
+
+def pytest_unconfigure(config):
+    """
+    Restores the listener of the enclosing session (if any), so steps of a finished session are not recorded anymore
+    """
+    sessions = pytest.allure._sessions
+    sessions[:] = [session for session in sessions if session[0] is not config]
+    pytest.allure._allurelistener = next((listener for (_, listener) in reversed(sessions)
+                                          if listener not in (None, CONFIGURING)), None)
 
 
 class AllureTestListener(object):
@@ -99,6 +421,23 @@ class AllureTestListener(object):
         self.environment = {}
         self.test = None
 
+        from allure.payload import PayloadEncoder
+        self.encoder = PayloadEncoder()
+
+        # That's the state stack. It can contain TestCases, TestSteps or DroppedSteps.
+        # Attaches and steps go to the object at top of the stack.
+        self.stack = StepStack()
+        self._lock = threading.Lock()
+
+        self.collapse_steps = config.option.allurecollapsesteps
+        self.max_sibling_steps = config.option.alluremaxsiblingsteps
+        self.max_steps = config.option.alluremaxsteps
+        self.max_step_depth = config.option.alluremaxstepdepth
+        self.precise_durations = config.option.allureprecisedurations
+        self.capture = config.option.allurecapture
+        self.capture_limit = config.option.allurecapturelimit
+        self.trace_limit = config.option.alluretracelimit
+
         # FIXME: that flag makes us pre-report failures in the makereport hook.
         # it is here to cope with xdist's begavior regarding -x.
         # see self.pytest_runtest_makereport and AllureAgregatingListener.pytest_sessionfinish
@@ -107,13 +446,15 @@ class AllureTestListener(object):
 
     @pytest.mark.hookwrapper
     def pytest_runtest_protocol(self, item, nextitem):
+        from allure.structure import TestCase
+
         try:
             # for common items
             description = item.function.__doc__
         except AttributeError:
             # for doctests that has no `function` attribute
             description = item.reportinfo()[2]
-        self.test = TestCase(name='.'.join(mangle_testnames([x.name for x in parent_down_from_module(item)])),
+        self.test = TestCase(name=case_name(item),
                              description=description,
                              start=now(),
                              attachments=[],
@@ -122,28 +463,39 @@ class AllureTestListener(object):
                              steps=[],
                              id=str(uuid.uuid4()))  # for later resolution in AllureAgregatingListener.pytest_sessionfinish
 
-        self.stack = [self.test]
+        self.stack.start(self.test)
+        self.omitted = {}  # id of a test or step => summary step of its omitted children
+        self.recorded_steps = 0
 
         yield
 
         self.test = None
-        self.stack = []
+        self.stack.finish()
+        self.omitted = {}
 
     def attach(self, title, contents, attach_type):
         """
         Store attachment object in current state for later actual write in the `AllureAgregatingListener.write_attach`
         """
+        parent = self.stack.top()
+        if isinstance(parent, DroppedStep):
+            return
+
+        from allure.structure import Attach
+
         attach = Attach(source=contents,  # we later re-save those, oh my...
                         title=title,
                         type=attach_type)
-        self.stack[-1].attachments.append(attach)
+        parent.attachments.append(attach)
 
     def dynamic_issue(self, *issues):
         """
         Attaches ``issues`` to the current active case
         """
         if self.test:
-            self.test.labels.extend([TestLabel(name=Label.ISSUE, value=issue) for issue in issues])
+            from allure.structure import TestLabel
+
+            self.test.labels.extend([TestLabel.interned(Label.ISSUE, issue) for issue in issues])
 
     def description(self, description):
         """
@@ -156,22 +508,120 @@ class AllureTestListener(object):
         """
         Starts an new :py:class:`allure.structure.TestStep` with given ``name``,
         pushes it to the ``self.stack`` and returns the step.
+
+        If the test already holds ``self.max_steps`` steps, the step would be deeper than ``self.max_step_depth``,
+        the parent already holds ``self.max_sibling_steps`` steps or is not recorded itself
+        pushes and returns a :py:class:`DroppedStep` instead.
         """
-        step = TestStep(name=name,
-                        title=name,
-                        start=now(),
-                        attachments=[],
-                        steps=[])
-        self.stack[-1].steps.append(step)
-        self.stack.append(step)
+        from allure.structure import TestStep
+
+        parent = self.stack.top()
+
+        with self._lock:
+            if isinstance(parent, DroppedStep):
+                step = DroppedStep(parent.summary)
+            elif self.max_steps is not None and self.recorded_steps >= self.max_steps or \
+                    self.max_step_depth is not None and self.stack.depth() > self.max_step_depth:
+                step = DroppedStep(self._omitted_summary(self.test))
+            elif self.max_sibling_steps is not None and len(parent.steps) >= self.max_sibling_steps:
+                step = DroppedStep(self._omitted_summary(parent))
+            else:
+                step = TestStep(name=name,
+                                title=name,
+                                start=now(),
+                                attachments=[],
+                                steps=[])
+                parent.steps.append(step)
+                self.recorded_steps += 1
+
+        self.stack.push(step)
         return step
 
-    def stop_step(self):
+    def stop_step(self, step=None):
         """
-        Stops the step at the top of ``self.stack``
+        Stops the step at the top of ``self.stack`` or a ``step`` that is suspended (then it stops when it was suspended)
+        """
+        suspended = step is not None
+        if not suspended:
+            step = self.stack.pop()
+
+        if isinstance(step, DroppedStep):
+            with self._lock:
+                summary = step.summary
+                summary.repeat += 1
+                summary.stop = now()
+                summary.status = max(summary.status, step.status or Status.PASSED, key=STATUS_PRIORITY.index)
+                summary.title = u'%d more steps omitted' % summary.repeat
+        elif not suspended:
+            step.stop = now()
+            if self.collapse_steps:
+                with self._lock:
+                    self._collapse_step(self.stack.top(), step)
+
+    def suspend_step(self):
+        """
+        Takes the step at the top of ``self.stack`` off it without stopping, to be resumed or stopped later
         """
         step = self.stack.pop()
-        step.stop = now()
+        if not isinstance(step, DroppedStep):
+            step.stop = now()
+
+    def resume_step(self, step):
+        """
+        Puts a suspended ``step`` back to the top of ``self.stack``
+        """
+        self.stack.push(step)
+
+    def _omitted_summary(self, parent):
+        """
+        Returns the step that counts omitted children of ``parent``, creating it on first use
+        """
+        summary = self.omitted.get(id(parent))
+        if summary is None:
+            from allure.structure import TestStep
+
+            summary = TestStep(name='Omitted steps',
+                               start=now(),
+                               attachments=[],
+                               steps=[],
+                               status=Status.PASSED,
+                               repeat=0)
+            parent.steps.append(summary)
+            self.omitted[id(parent)] = summary
+        return summary
+
+    def _collapse_step(self, parent, step):
+        """
+        Merges just stopped ``step`` into the previous sibling if they have the same name and status and hold nothing.
+
+        Merged step keeps the repeat count and the total, the shortest and the longest durations.
+        """
+        siblings = parent.steps
+        if len(siblings) < 2 or siblings[-1] is not step:
+            return
+
+        previous = siblings[-2]
+        if previous.name != step.name or previous.status != step.status or \
+                previous.steps or previous.attachments or step.steps or step.attachments:
+            return
+
+        if previous.repeat is None:
+            previous.repeat = 1
+            previous.duration = previous.shortest = previous.longest = previous.stop - previous.start
+
+        duration = step.stop - step.start
+        previous.repeat += 1
+        previous.duration += duration
+        previous.shortest = min(previous.shortest, duration)
+        previous.longest = max(previous.longest, duration)
+        previous.stop = step.stop
+        previous.title = u'%s [x%d, total %d ms, min %d ms, max %d ms]' % (previous.name,
+                                                                           previous.repeat,
+                                                                           previous.duration,
+                                                                           previous.shortest,
+                                                                           previous.longest)
+        siblings.pop()
+        self.recorded_steps -= 1
 
     def _fill_case(self, report, call, pyteststatus, status):
         """
@@ -181,14 +631,31 @@ class AllureTestListener(object):
         :param pyteststatus: the failed/xfailed/xpassed thing
         :param status: a :py:class:`allure.constants.Status` entry
         """
-        [self.attach(name, contents, AttachmentType.TEXT) for (name, contents) in dict(report.sections).items()]
+        from allure.structure import TestLabel, Failure
+
+        if self.capture == 'always' or self.capture == 'failed' and status in FAILED_STATUSES:
+            for (name, contents) in dict(report.sections).items():
+                if self.capture_limit is not None:
+                    contents = elide(contents, self.capture_limit)  # before it is pickled to go to the master
+                self.attach(name, contents, AttachmentType.TEXT)
 
         self.test.stop = now()
         self.test.status = status
 
+        if self.precise_durations:
+            self.test.labels = [label for label in self.test.labels if label.name != Label.DURATION_US]
+            self.test.labels.append(TestLabel(name=Label.DURATION_US, value=int(round((self.test.stop - self.test.start) * 1000))))
+
         if status in FAILED_STATUSES:
+            trace = report.longrepr or hasattr(report, 'wasxfail') and report.wasxfail
+            if trace:
+                # as text, it is lighter to pickle and is sent once for the same ones, see allure.payload
+                trace = unicodify(trace)
+                if self.trace_limit is not None:
+                    trace = elide(trace, self.trace_limit)
+
             self.test.failure = Failure(message=get_exception_message(call.excinfo, pyteststatus, report),
-                                        trace=report.longrepr or hasattr(report, 'wasxfail') and report.wasxfail)
+                                        trace=trace)
         elif status in SKIPPED_STATUSES:
             skip_message = type(report.longrepr) == tuple and report.longrepr[2] or report.wasxfail
             trim_msg_len = 89
@@ -202,13 +669,28 @@ class AllureTestListener(object):
         """
         Adds `self.test` to the `report` in a `AllureAggegatingListener`-understood way
         """
+        self._stop_open_steps()
+
         parent = parent_module(item)
-        # we attach a four-tuple: (test module ID, test module name, test module doc, environment, TestCase)
-        report.__dict__.update(_allure_result=pickle.dumps((parent.nodeid,
-                                                            parent.module.__name__,
-                                                            parent.module.__doc__ or '',
-                                                            self.environment,
-                                                            self.test)))
+        # module and environment are sent only when those are new, see allure.payload
+        report.__dict__.update(_allure_result=self.encoder.encode(parent.nodeid,
+                                                                  parent.module.__name__,
+                                                                  parent.module.__doc__ or '',
+                                                                  self.environment,
+                                                                  self.test))
+
+    def _stop_open_steps(self):
+        """
+        Stops steps of the test that are still open (in threads or tasks the test has left running) as canceled ones
+        """
+        steps = list(self.test.steps)
+        stop = now()
+        while steps:
+            step = steps.pop()
+            steps.extend(step.steps)
+            if step.stop is None:
+                step.stop = stop
+                step.status = step.status or Status.CANCELED
 
     @pytest.mark.hookwrapper
     def pytest_runtest_makereport(self, item, call):
@@ -277,14 +759,209 @@ class AllureTestListener(object):
                 self.report_case(item, report)
 
 
-def pytest_runtest_setup(item):
-    item_labels = set((l.name, l.value) for l in labels_of(item))  # see label_type
+class AllureFixtureListener(object):
+    """
+    Records setup and teardown of fixtures as steps of the test that triggers them.
+
+    Setup step is recorded around the ``pytest_fixture_setup`` hook.
+    Finalizers the fixture registers while it is set up (as the code after ``yield`` of a generator fixture)
+    are caught by ``addfinalizer`` of the fixture definition, that is shadowed for the setup,
+    and are registered as a single one, that runs them in a teardown step, so the step fails if they do.
+
+    Recorded steps are marked with ``fixture`` field of ``(name, scope, phase)`` for :py:class:`allure.summary.SessionSummary`.
+    """
+
+    def __init__(self, testlistener):
+        self.listener = testlistener
+
+    @pytest.mark.hookwrapper
+    def pytest_fixture_setup(self, fixturedef, request):
+        if self.listener.test is None:
+            yield
+            return
+
+        finalizers = []
+        step = self._start(fixturedef, 'setup')
+        fixturedef.addfinalizer = finalizers.append
+        try:
+            outcome = yield
+        finally:
+            del fixturedef.addfinalizer
+        self._stop(step, outcome.excinfo)
+
+        fixturedef.addfinalizer(lambda: self._teardown(fixturedef, finalizers))
+
+    def _teardown(self, fixturedef, finalizers):
+        """
+        Runs ``finalizers`` of the fixture as ``FixtureDef.finish`` would (the last one first, all of them, re-raising the first error)
+        """
+        step = self._start(fixturedef, 'teardown') if self.listener.test is not None else None
+
+        excinfo = None
+        for finalizer in reversed(finalizers):
+            try:
+                finalizer()
+            except BaseException:
+                excinfo = excinfo or sys.exc_info()
+
+        if step is not None:
+            self._stop(step, excinfo)
+        if excinfo is not None:
+            reraise(*excinfo)
+
+    def _start(self, fixturedef, phase):
+        step = self.listener.start_step(u'%s fixture %s' % (phase.capitalize(), fixturedef.argname))
+        if not isinstance(step, DroppedStep):
+            step.fixture = (fixturedef.argname, fixturedef.scope, phase)
+        return step
+
+    def _stop(self, step, excinfo):
+        if excinfo is None:
+            step.status = Status.PASSED
+        elif excinfo[0] == Skipped:
+            step.status = Status.CANCELED
+        else:
+            step.status = Status.FAILED
+        self.listener.stop_step()
+
+
+class DroppedStep(object):
+    """
+    Stand-in for a step that is not recorded.
+
+    Keeps only the ``status`` (as set by :py:class:`allure.common.StepContext`)
+    and the ``summary`` step it is counted in.
+    """
+
+    __slots__ = ('status', 'summary')
+
+    def __init__(self, summary):
+        self.status = None
+        self.summary = summary
+
+
+class ThreadStepStack(object):
+    """
+    State stack for :py:class:`AllureTestListener` with a separate stack per thread.
+
+    Threads other than the one running the test root their stacks at the step
+    that is open in the test's thread when they start a step from the bottom of their stack,
+    so steps of spawned threads go under the step that spawned them.
+    """
 
+    def __init__(self):
+        self.local = threading.local()
+        self.test = None
+        self.test_stack = []
+
+    def start(self, test):
+        """
+        Starts the stack with ``test``, to be called in the thread that runs the test
+        """
+        self.test = self.local.test = test
+        self.test_stack = self.local.stack = [test]
+        self.local.base = 0
+
+    def finish(self):
+        self.test = None
+        self.test_stack = self.local.stack = []
+
+    def _stack(self):
+        local = self.local
+        if getattr(local, 'test', None) is not self.test:
+            local.test, local.stack, local.base = self.test, self.test_stack[-1:], len(self.test_stack) - 1
+        elif len(local.stack) == 1 and local.stack is not self.test_stack:
+            local.stack[0], local.base = self.test_stack[-1], len(self.test_stack) - 1
+        return local.stack
+
+    def top(self):
+        return self._stack()[-1]
+
+    def depth(self):
+        stack = self._stack()
+        return self.local.base + len(stack)  # counts the steps of the test's thread a thread went under
+
+    def push(self, item):
+        self._stack().append(item)
+
+    def pop(self):
+        stack = self._stack()
+        if len(stack) < 2:  # the bottom is the test or the step the thread went under, not one of its steps
+            raise RuntimeError('No step is open in this thread')
+        return stack.pop()
+
+
+class ContextStepStack(object):
+    """
+    State stack for :py:class:`AllureTestListener` kept in a context variable,
+    so each thread and each asyncio task has its own one.
+
+    The stack is a linked list of immutable ``(item, parent node, depth, test)`` nodes.
+    A task starts with the node of the code that created it, so its steps go under the step that spawned it.
+    Threads start with an empty context and behave as in :py:class:`ThreadStepStack`.
+    """
+
+    def __init__(self):
+        self.var = ContextVar('allure_step_stack', default=None)
+        self.test = None
+        self.test_thread = None
+        self.test_top = None  # top node of the thread that runs the test
+
+    def start(self, test):
+        self.test = test
+        self.test_thread = threading.current_thread()
+        self.test_top = (test, None, 1, test)
+        self.var.set(self.test_top)
+
+    def finish(self):
+        self.test = self.test_thread = self.test_top = None
+        self.var.set(None)
+
+    def _node(self):
+        """
+        Returns the top node of the current context or ``None`` if this thread has no steps of the current test open
+        """
+        node = self.var.get()
+        if node is not None and node[3] is self.test:
+            return node
+
+    def top(self):
+        return (self._node() or self.test_top)[0]
+
+    def depth(self):
+        return (self._node() or self.test_top)[2]
+
+    def push(self, item):
+        node = self._node()
+        # steps started from the bottom of a thread's stack have no parent node, so the thread picks a fresh root after them
+        node = (item, node, (node or self.test_top)[2] + 1, self.test)
+        self.var.set(node)
+        if threading.current_thread() is self.test_thread:
+            self.test_top = node
+
+    def pop(self):
+        node = self._node()
+        if node is None or node[0] is self.test:  # the bottom, that is the test itself
+            raise RuntimeError('No step is open in this thread or task')
+        self.var.set(node[1])
+        if threading.current_thread() is self.test_thread:
+            self.test_top = node[1]
+        return node[0]
+
+
+StepStack = ContextStepStack if ContextVar is not None else ThreadStepStack  # the one listeners use
+
+
+def pytest_runtest_setup(item):
     arg_labels = set().union(item.config.option.allurefeatures,
                              item.config.option.allurestories,
                              item.config.option.allureseverities)
+    if not arg_labels:
+        return
+
+    item_labels = set((l.name, l.value) for l in labels_of(item))  # see label_type
 
-    if arg_labels and not item_labels & arg_labels:
+    if not item_labels & arg_labels:
         pytest.skip('Not suitable with selected labels: %s.' % ', '.join(text_type(l) for l in sorted(arg_labels)))
 
 
@@ -299,17 +976,29 @@ class LazyInitStepContext(StepContext):
         self.allure_helper = allure_helper
         self.title = title
         self.step = None
+        self.suspended = False
 
     @property
     def allure(self):
-        listener = self.allure_helper.get_listener()
+        listener = self.allure_helper._allurelistener
 
-        # if listener has `stack` we are inside a test
+        # if listener has `test` we are inside a test
         # record steps only when that
         # FIXME: this breaks encapsulation a lot
-        if hasattr(listener, 'stack'):
+        if listener is not None and listener.test is not None:
             return listener
 
+    def __call__(self, func):
+        """
+        Returns ``func`` itself if it is decorated inside a session that does not record anything,
+        so its calls cost nothing at all.
+        """
+        sessions = self.allure_helper._sessions
+        if sessions and sessions[-1][1] is None and self.allure_helper._allurelistener is None:
+            return func
+
+        return StepContext.__call__(self, func)
+
 
 class AllureHelper(object):
 
@@ -319,6 +1008,7 @@ class AllureHelper(object):
 
     def __init__(self):
         self._allurelistener = None  # FIXME: this gets injected elsewhere, like in the pytest_configure
+        self._sessions = []  # [config, listener] of pytest sessions, innermost last; listener is ``None`` when not reporting
 
     def get_listener(self):
         return self._allurelistener
@@ -468,78 +1158,235 @@ def pytest_namespace():
 class AllureAgregatingListener(object):
 
     """
-    Listens to pytest hooks to generate reports for common tests.
+    Listens to pytest hooks to hand results of common tests to the ``aggregator``,
+    a :py:class:`allure.aggregator.ResultAggregator` or a :py:class:`allure.aggregator.ProcessAggregator`.
     """
 
-    def __init__(self, impl, config):
-        self.impl = impl
-
-        # module's nodeid => TestSuite object
-        self.suites = {}
+    def __init__(self, aggregator):
+        self.aggregator = aggregator
 
+    @pytest.mark.trylast
     def pytest_sessionfinish(self):
         """
-        We are done and have all the results in `self.suites`
-        Lets write em down.
+        We are done, so the aggregator writes everything down (after the collection failures are in)
+        """
+        self.aggregator.finish()
 
-        But first we kinda-unify the test cases.
+    def pytest_unconfigure(self):
+        """
+        Closes the writer after everyone is done with it
+        """
+        self.aggregator.close()
 
-        We expect cases to come from AllureTestListener -- and the have ._id field to manifest their identity.
+    @pytest.mark.tryfirst
+    def pytest_runtest_logreport(self, report):
+        """
+        Takes the result off the report (before xdist node sends it to the master)
+        """
+        if hasattr(report, '_allure_result'):
+            # so actual pickled data is garbage-collected, see https://github.com/allure-framework/allure-python/issues/98
+            payload = report.__dict__.pop('_allure_result')
 
-        Of all the test cases in suite.testcases we leave LAST with the same ID -- becase logreport can be sent MORE THAN ONE TIME
-        (namely, if the test fails and then gets broken -- to cope with the xdist's -x behavior we have to have tests even at CALL failures)
+            self.aggregator.add_result(report.nodeid, payload)
 
-        TODO: do it in a better, more efficient way
-        """
 
-        for s in self.suites.values():
-            if s.tests:  # nobody likes empty suites
-                s.stop = max(case.stop for case in s.tests)
+class AllureWorkerListener(object):
+    """
+    Hands the environment to the master from an xdist node that writes its own suites, so the master writes it once.
+    """
 
-                known_ids = set()
-                refined_tests = []
-                for t in s.tests[::-1]:
-                    if t.id not in known_ids:
-                        known_ids.add(t.id)
-                        refined_tests.append(t)
-                s.tests = refined_tests[::-1]
+    def __init__(self, testlistener, config):
+        self.testlistener = testlistener
+        self.config = config
 
-                with self.impl._reportfile('%s-testsuite.xml' % uuid.uuid4()) as f:
-                    self.impl._write_xml(f, s)
+    @pytest.mark.tryfirst
+    def pytest_sessionfinish(self):
+        # values are sent as text, as the xdist channel takes only builtin types
+        self.config.slaveoutput['allure_environment'] = dict((key, unicodify(value))
+                                                             for key, value in self.testlistener.environment.items())
 
-        self.impl.store_environment()
 
-    def write_attach(self, attachment):
-        """
-        Writes attachment object from the `AllureTestListener` to the FS, fixing it fields
+class AllureWorkerSuitesListener(object):
+    """
+    Gathers environments of xdist nodes that write their own suites for the master's ``aggregator``.
+    """
 
-        :param attachment: a :py:class:`allure.structure.Attach` object
-        """
+    def __init__(self, aggregator):
+        self.aggregator = aggregator
 
-        # OMG, that is bad
-        attachment.source = self.impl._save_attach(attachment.source, attachment.type)
-        attachment.type = attachment.type.mime_type
+    def pytest_testnodedown(self, node, error):
+        self.aggregator.add_environment(getattr(node, 'slaveoutput', {}).get('allure_environment', {}))
 
-    def pytest_runtest_logreport(self, report):
-        if hasattr(report, '_allure_result'):
-            module_id, module_name, module_doc, environment, testcase = pickle.loads(report._allure_result)
 
-            report._allure_result = None  # so actual pickled data is garbage-collected, see https://github.com/allure-framework/allure-python/issues/98
+def result_key(item):
+    """
+    Returns ``(module name, case name)`` the ``item`` is known by in allure results
+    """
+    return parent_module(item).module.__name__, case_name(item)
 
-            self.impl.environment.update(environment)
 
-            for a in testcase.iter_attachments():
-                self.write_attach(a)
+class AllureSchedulingListener(object):
+    """
+    Selects collected tests of the shard by their ``shard_durations`` (a :py:class:`allure.durations.ResultDurations`)
+    and orders them by their ``durations`` in the :py:class:`allure.durations.DurationDB`, longest first.
 
-            self.suites.setdefault(module_id, TestSuite(name=module_name,
-                                                        description=module_doc,
-                                                        tests=[],
-                                                        labels=[],
-                                                        start=testcase.start,  # first case starts the suite!
-                                                        stop=None)).tests.append(testcase)
+    Runs on every xdist node, as those collect the tests themselves.
+    """
+
+    def __init__(self, durations, shard_durations, config):
+        self.durations = durations
+        self.shard_durations = shard_durations
+        self.config = config
+        self.shard = config.option.allureshard
+        self.longest_first = config.option.allurelongestfirst
+
+    @pytest.mark.trylast
+    def pytest_collection_modifyitems(self, items):
+        from allure.durations import longest_first, shard
+
+        if self.shard:
+            selected, deselected = shard(items, self.shard_durations, *self.shard, key=result_key)
+            if deselected:
+                self.config.hook.pytest_deselected(items=deselected)
+            items[:] = selected
+
+        if self.longest_first:
+            items[:] = longest_first(items, self.durations)
+
+
+class AllureRerunListener(object):
+    """
+    Deselects collected tests that are not in ``rerun`` set of ``(module name, case name)``.
+
+    Tests of modules (or of any other collectors) that failed to collect are kept as well,
+    those are in ``rerun`` as cases of the collection phase suite.
+    """
+
+    def __init__(self, rerun, config):
+        self.rerun = rerun
+        self.config = config
+        self.broken = set(name for suite, name in rerun if suite == COLLECTION_SUITE)
+
+    def pytest_collection_modifyitems(self, items):
+        selected, deselected = [], []
+        for item in items:
+            if result_key(item) in self.rerun or (self.broken and self._collected_broken(item)):
+                selected.append(item)
+            else:
+                deselected.append(item)
 
+        if deselected:
+            self.config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
 
-CollectFail = namedtuple('CollectFail', 'name status message trace')
+    def _collected_broken(self, item):
+        names = collector_name(item.nodeid).split('.')
+        return any('.'.join(names[:i]) in self.broken for i in range(1, len(names)))
+
+
+class AllureRerunNodeListener(object):
+    """
+    Passes tests to rerun to xdist nodes, as they start after the report directory is cleared.
+    """
+
+    def __init__(self, rerun):
+        self.rerun = rerun
+
+    def pytest_configure_node(self, node):
+        node.slaveinput['allure_rerun'] = sorted(self.rerun)
+
+
+class AllureShardNodeListener(object):
+    """
+    Passes durations to split tests by to xdist nodes, as they start after the report directory is cleared.
+    """
+
+    def __init__(self, durations):
+        self.durations = durations
+
+    def pytest_configure_node(self, node):
+        # as a list, the xdist channel takes no tuple keys
+        node.slaveinput['allure_shard_durations'] = [[module, case, duration] for ((module, case), duration) in self.durations.durations.items()]
+
+
+CollectFail = namedtuple('CollectFail', 'nodeid name status message trace time')
+
+COLLECTION_SUITE = 'test_collection_phase'
+
+
+class AllureCollectionTimer(object):
+    """
+    Times collection of test modules, from ``pytest_collectstart`` to ``pytest_collectreport``,
+    and notes the modules that got imported first while collecting each of them.
+
+    While collecting, the timer sits first in :py:data:`sys.meta_path`, where it records the names of modules
+    looked up, so only what is imported anew is looked at for every test module.
+
+    ``times`` is a dict of ``nodeid => [start, stop, imported modules]`` of test modules,
+    on an xdist node it is sent to the master.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.started = {}  # nodeid => (collector, start, number of names looked up before)
+        self.looked_up = []
+        self.times = {}
+
+    def find_spec(self, name, path=None, target=None):
+        self.looked_up.append(name)
+        return None  # the finders that follow do the import
+
+    def find_module(self, name, path=None):  # Python 2
+        return self.find_spec(name, path)
+
+    @pytest.mark.tryfirst
+    def pytest_collection(self):
+        sys.meta_path.insert(0, self)
+
+    def pytest_collection_finish(self):
+        self.stop_recording()
+
+    def stop_recording(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def pytest_collectstart(self, collector):
+        if isinstance(collector, pytest.Module):
+            self.started[collector.nodeid] = (collector, now(), len(self.looked_up))
+
+    def pytest_collectreport(self, report):
+        started = self.started.pop(report.nodeid, None)
+        if started is not None:
+            collector, start, looked_up = started
+            module = getattr(collector, '_obj', None)  # not there if the import has failed
+            imported = set(name for name in self.looked_up[looked_up:] if name in sys.modules)
+            imported.discard(module and module.__name__)
+            self.times[report.nodeid] = [start, now(), sorted(imported)]
+
+    def add(self, times):
+        """
+        Adds ``times`` of an xdist node, those of the first node are kept for modules that many nodes collect
+        """
+        for nodeid, entry in times.items():
+            self.times.setdefault(nodeid, entry)
+
+    @pytest.mark.tryfirst
+    def pytest_sessionfinish(self):
+        self.stop_recording()
+        if hasattr(self.config, 'slaveoutput'):
+            self.config.slaveoutput['allure_collection'] = self.times
+
+
+class AllureCollectionNodeListener(object):
+    """
+    Passes collection times of xdist nodes to the master's :py:class:`AllureCollectionTimer`.
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def pytest_testnodedown(self, node, error):
+        self.timer.add(getattr(node, 'slaveoutput', {}).get('allure_collection', {}))
 
 
 class AllureCollectionListener(object):
@@ -547,10 +1394,14 @@ class AllureCollectionListener(object):
     """
     Listens to pytest collection-related hooks
     to generate reports for modules that failed to collect.
+
+    If there is a ``timer`` (a :py:class:`AllureCollectionTimer`), the report has all the collected modules,
+    slowest first, with their collection times.
     """
 
-    def __init__(self, impl):
-        self.impl = impl
+    def __init__(self, aggregator, timer=None):
+        self.aggregator = aggregator
+        self.timer = timer
         self.fails = []
 
     def pytest_collectreport(self, report):
@@ -560,21 +1411,64 @@ class AllureCollectionListener(object):
             else:
                 status = Status.CANCELED
 
-            self.fails.append(CollectFail(name=mangle_testnames(report.nodeid.split("::"))[-1],
+            self.fails.append(CollectFail(nodeid=report.nodeid,
+                                          name=collector_name(report.nodeid),
                                           status=status,
                                           message=get_exception_message(None, None, report),
-                                          trace=report.longrepr))
+                                          trace=unicodify(report.longrepr),
+                                          time=now()))
 
     def pytest_sessionfinish(self):
         """
-        Creates a testsuite with collection failures if there were any.
+        Creates a testsuite with collection failures (and times) if there were any.
         """
-
-        if self.fails:
-            self.impl.start_suite(name='test_collection_phase',
-                                  title='Collection phase',
-                                  description='This is the tests collection phase. Failures are modules that failed to collect.')
-            for fail in self.fails:
-                self.impl.start_case(name=fail.name.split(".")[-1])
-                self.impl.stop_case(status=fail.status, message=fail.message, trace=fail.trace)
-            self.impl.stop_suite()
+        from allure.structure import TestCase, TestSuite, Failure
+
+        times = self.timer.times if self.timer else {}
+
+        tests = []
+        for fail in self.fails:
+            start, stop, _ = times.get(fail.nodeid, (fail.time, fail.time, None))
+            tests.append(TestCase(name=fail.name,
+                                  status=fail.status,
+                                  failure=Failure(message=fail.message, trace=fail.trace),
+                                  start=start,
+                                  stop=stop,
+                                  attachments=[],
+                                  labels=[],
+                                  steps=[]))
+
+        failed = set(fail.nodeid for fail in self.fails)
+        for nodeid, (start, stop, modules) in sorted(times.items(), key=lambda entry: entry[1][0] - entry[1][1]):
+            if nodeid not in failed:
+                tests.append(TestCase(name=collector_name(nodeid),
+                                      description=self._imported(modules),
+                                      status=Status.PASSED,
+                                      start=start,
+                                      stop=stop,
+                                      attachments=[],
+                                      labels=[],
+                                      steps=[]))
+
+        if tests:
+            description = 'This is the tests collection phase. Failures are modules that failed to collect.'
+            if times:
+                description += ' Durations are times to collect the modules, slowest go first.'
+
+            self.aggregator.add_suite(TestSuite(name=COLLECTION_SUITE,
+                                                title='Collection phase',
+                                                description=description,
+                                                tests=tests,
+                                                labels=[],
+                                                start=min(test.start for test in tests),
+                                                stop=now()))
+
+    @staticmethod
+    def _imported(modules):
+        """
+        Describes ``modules`` imported while collecting a test module by their top-level packages
+        """
+        packages = sorted(set(module.split('.')[0] for module in modules))
+        if not packages:
+            return None
+        return u'Imported %d modules of %s' % (len(modules), ', '.join(packages))
@@ -0,0 +1,144 @@
+"""
+Reading of allure result directories in constant memory.
+
+Suite files are parsed with :py:func:`lxml.etree.iterparse` and every test case element is cleared once read,
+so memory does not grow with the number of cases.
+
+Results are read as :py:mod:`allure.structure` objects::
+
+  for suite, case in read_results('./reports', statuses=[Status.FAILED]):
+      print(suite.name, case.name, [step.title for step in case.steps])
+"""
+
+import os
+
+from lxml import etree
+
+from allure.constants import FAILED_STATUSES
+from allure.structure import TestSuite, TestCase, TestStep, Attach, Failure, TestLabel
+
+
+def suite_files(directory):
+    """
+    Returns sorted paths of ``*-testsuite.xml`` files in ``directory``
+    """
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('-testsuite.xml'))
+
+
+def suite_name(path):
+    """
+    Returns name of the suite in the file at ``path``, reading only as far as it
+    """
+    depth = 0
+    for event, elem in etree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+        else:
+            depth -= 1
+            if elem.tag == 'name' and depth == 1:
+                return elem.text
+
+
+def read_suite_file(path, statuses=None, labels=None):
+    """
+    Yields ``(suite, case)`` pairs of :py:class:`allure.structure.TestSuite` and :py:class:`allure.structure.TestCase`
+    for every test case in the suite file at ``path``.
+
+    Suite is the same object for all the cases of the file and holds no cases itself.
+    Its ``labels`` list is filled in when those are read: this plugin writes them after the cases,
+    so they are there only once the last case of the file is yielded and the file is read to the end.
+
+    Cases are filtered while parsing, before they are converted to objects:
+    :arg statuses: if given, only cases with one of those statuses are read
+    :arg labels: if given, only cases with at least one of those ``(name, value)`` labels are read
+    """
+    suite = None
+    root = None
+    depth = 0
+    suite_labels = []
+
+    for event, elem in etree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if elem.tag == 'labels' and depth == 1:
+            suite_labels.extend(read_labels(elem, 'label'))
+            continue
+        if elem.tag != 'test-case' or depth != 2:
+            continue
+
+        if (statuses is None or elem.get('status') in statuses) and \
+                (labels is None or any((l.get('name'), l.get('value')) in labels for l in elem.iterfind('labels/label'))):
+            if suite is None:
+                suite = TestSuite(name=root.findtext('name'),
+                                  title=root.findtext('title'),
+                                  description=root.findtext('description'),
+                                  tests=[],
+                                  labels=suite_labels,
+                                  start=read_time(root.get('start')),
+                                  stop=read_time(root.get('stop')))
+            yield suite, read_case(elem)
+
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def read_results(directory, statuses=None, labels=None):
+    """
+    Yields ``(suite, case)`` pairs for every test case in results at ``directory``, see :py:func:`read_suite_file`
+    """
+    for path in suite_files(directory):
+        for suite, case in read_suite_file(path, statuses, labels):
+            yield suite, case
+
+
+def failed_tests(directory, statuses=FAILED_STATUSES):
+    """
+    Returns a set of ``(suite name, case name)`` of test cases that got one of ``statuses`` in results at ``directory``
+    """
+    return set((suite.name, case.name) for (suite, case) in read_results(directory, statuses=statuses))
+
+
+def read_time(value):
+    return int(value) if value is not None else None
+
+
+def read_labels(elem, path='labels/label'):
+    # not interned, as values like durations and issues are unique to their cases and would pile up in the table
+    return [TestLabel(name=l.get('name'), value=l.get('value')) for l in elem.iterfind(path)]
+
+
+def read_attachments(elem):
+    return [Attach(source=a.get('source'), title=a.get('title'), type=a.get('type')) for a in elem.iterfind('attachments/attachment')]
+
+
+def read_step(elem):
+    return TestStep(name=elem.findtext('name'),
+                    title=elem.findtext('title'),
+                    attachments=read_attachments(elem),
+                    steps=[read_step(s) for s in elem.iterfind('steps/step')],
+                    start=read_time(elem.get('start')),
+                    stop=read_time(elem.get('stop')),
+                    status=elem.get('status'))
+
+
+def read_case(elem):
+    failure = elem.find('failure')
+    if failure is not None:
+        failure = Failure(message=failure.findtext('message'), trace=failure.findtext('stack-trace'))
+
+    return TestCase(name=elem.findtext('name'),
+                    title=elem.findtext('title'),
+                    description=elem.findtext('description'),
+                    failure=failure,
+                    steps=[read_step(s) for s in elem.iterfind('steps/step')],
+                    attachments=read_attachments(elem),
+                    labels=read_labels(elem),
+                    status=elem.get('status'),
+                    start=read_time(elem.get('start')),
+                    stop=read_time(elem.get('stop')))
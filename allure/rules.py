@@ -8,14 +8,15 @@ Simple object-to-XML binding mechanism.
 import re
 import sys
 
-from six import u, unichr
-from lxml import objectify
+from six import u, unichr, text_type
 from namedlist import namedlist
 
 from allure.utils import unicodify
 
 
 def element_maker(name, namespace):
+    from lxml import objectify
+
     return getattr(objectify.ElementMaker(annotate=False, namespace=namespace,), name)
 
 
@@ -52,10 +53,14 @@ _legal_ranges = (
 )
 _legal_xml_re = [u("%s-%s") % (unichr(low), unichr(high)) for (low, high) in _legal_ranges if low < sys.maxunicode]
 _legal_xml_re = [unichr(x) for x in _legal_chars] + _legal_xml_re
-illegal_xml_re = re.compile(u('[^%s]') % u('').join(_legal_xml_re))
+illegal_xml_re = None  # compiled on first use, as that takes a while
 
 
 def legalize_xml(arg):
+    global illegal_xml_re
+    if illegal_xml_re is None:
+        illegal_xml_re = re.compile(u('[^%s]') % u('').join(_legal_xml_re))
+
     def repl(matchobj):
         i = ord(matchobj.group())
         if i <= 0xFF:
@@ -86,6 +91,17 @@ class Attribute(Rule):
         return legalize_xml(unicodify(what))
 
 
+class Timestamp(Attribute):
+    """
+    Milliseconds attribute, rounds fractional values of :py:func:`allure.utils.now` (and writes ``None`` as is)
+    """
+
+    def value(self, name, what):
+        if what is None:
+            return super(Timestamp, self).value(name, what)
+        return text_type(int(round(what)))
+
+
 class Nested(Rule):
 
     def value(self, name, what):
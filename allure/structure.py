@@ -7,7 +7,7 @@ Created on Oct 23, 2013
 '''
 
 from allure.rules import xmlfied, Attribute, Element, WrappedMany, Nested, Many, \
-    Ignored
+    Ignored, Timestamp
 from allure.constants import ALLURE_NAMESPACE, COMMON_NAMESPACE
 
 
@@ -54,8 +54,8 @@ class TestCase(IterAttachmentsMixin,
                        attachments=WrappedMany(Nested()),
                        labels=WrappedMany(Nested()),
                        status=Attribute(),
-                       start=Attribute(),
-                       stop=Attribute())):
+                       start=Timestamp(),
+                       stop=Timestamp())):
     pass
 
 
@@ -66,8 +66,8 @@ class TestSuite(xmlfied('test-suite',
                         description=Element().if_(lambda x: x),
                         tests=WrappedMany(Nested(), name='test-cases'),
                         labels=WrappedMany(Nested()),
-                        start=Attribute(),
-                        stop=Attribute())):
+                        start=Timestamp(),
+                        stop=Timestamp())):
     pass
 
 
@@ -77,16 +77,43 @@ class TestStep(IterAttachmentsMixin,
                        title=Element().if_(lambda x: x),
                        attachments=WrappedMany(Nested()),
                        steps=WrappedMany(Nested()),
-                       start=Attribute(),
-                       stop=Attribute(),
-                       status=Attribute())):
+                       start=Timestamp(),
+                       stop=Timestamp(),
+                       status=Attribute(),
+                       repeat=Ignored(),  # internal fields for collapsed and omitted steps, see AllureTestListener
+                       duration=Ignored(),
+                       shortest=Ignored(),
+                       longest=Ignored(),
+                       fixture=Ignored())):  # (name, scope, phase) of a fixture step, see AllureFixtureListener
     pass
 
 
 class TestLabel(xmlfied('label',
                         name=Attribute(),
                         value=Attribute())):
-    pass
+    """
+    Labels are shared by many tests, so there is a single one of those made with :py:meth:`interned`
+    for each name and value. It is shared, so it must not be changed.
+    """
+
+    _interned = {}  # (name, value) => TestLabel
+
+    @classmethod
+    def interned(cls, name, value):
+        try:
+            label = cls._interned.get((name, value))
+        except TypeError:  # unhashable value is not worth interning
+            return cls(name=name, value=value)
+
+        if label is None:
+            label = cls._interned[(name, value)] = cls(name=name, value=value)
+        return label
+
+    def is_interned(self):
+        try:
+            return self._interned.get((self.name, self.value)) is self
+        except TypeError:
+            return False
 
 
 class EnvParameter(xmlfied('parameter',
@@ -0,0 +1,156 @@
+"""
+Session-wide duration summary, so performance hotspots can be found without parsing every suite XML.
+"""
+
+import heapq
+import math
+from array import array
+
+from six import text_type, iteritems
+
+from allure.constants import Label
+
+
+def percentile(ordered, share):
+    """
+    Nearest-rank percentile of sorted non-empty list ``ordered``, ``share`` is from 0 to 1
+    """
+    return ordered[max(0, int(math.ceil(share * len(ordered))) - 1)]
+
+
+class TopK(object):
+    """
+    Keeps ``size`` items with the largest keys seen, in a bounded heap
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.heap = []
+        self.counter = 0  # breaks ties, so items are never compared
+
+    def add(self, key, item):
+        self.counter += 1
+        entry = (key, self.counter, item)
+        if len(self.heap) < self.size:
+            heapq.heappush(self.heap, entry)
+        elif key > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def items(self):
+        return [item for (_, _, item) in sorted(self.heap, reverse=True)]
+
+
+class SessionSummary(object):
+    """
+    Aggregates durations of test cases and their steps as they come.
+
+    Keeps ``size`` slowest tests, ``size`` slowest step titles by total and by max time
+    and per-module, per-feature and per-story durations of tests to report their percentiles.
+
+    Step totals are kept for every distinct step title, so memory grows with the number of those.
+    Percentiles are exact, so a duration of every test is kept for its module and for each of its features and stories:
+    memory grows with the number of tests too, by 8 bytes per test and group.
+
+    Fixture steps (see :py:class:`allure.pytest_plugin.AllureFixtureListener`) are also totalled per scope and fixture.
+    """
+
+    DEFAULT_SIZE = 10
+
+    def __init__(self, size):
+        self.size = size
+        self.seen = set()
+        self.count = 0
+        self.total = 0.0
+        self.slowest_tests = TopK(size)
+        self.steps = {}  # title => [count, total, max]
+        self.groups = {'modules': {}, 'features': {}, 'stories': {}}  # group name => name => array of durations
+        self.fixtures = {}  # scope => fixture name => phase => [count, total]
+
+    def add(self, module_name, testcase):
+        """
+        Accounts ``testcase`` from module ``module_name``, does nothing if the case is already accounted
+        """
+        if testcase.id in self.seen:
+            return
+        self.seen.add(testcase.id)
+
+        duration = testcase.stop - testcase.start
+        self.count += 1
+        self.total += duration
+        self.slowest_tests.add(duration, (module_name, testcase.name, duration))
+
+        self.groups['modules'].setdefault(module_name, array('d')).append(duration)
+        for label in testcase.labels:
+            if label.name == Label.FEATURE:
+                self.groups['features'].setdefault(label.value, array('d')).append(duration)
+            elif label.name == Label.STORY:
+                self.groups['stories'].setdefault(label.value, array('d')).append(duration)
+
+        steps = list(testcase.steps)
+        while steps:
+            step = steps.pop()
+            steps.extend(step.steps)
+
+            if step.start is None or step.stop is None:  # left open by a thread or a task
+                continue
+            elif step.repeat is None:
+                count, total, longest = 1, step.stop - step.start, step.stop - step.start
+            elif step.duration is not None:  # collapsed step
+                count, total, longest = step.repeat, step.duration, step.longest
+            else:  # summary of omitted steps
+                continue
+
+            if step.fixture is not None:
+                name, scope, phase = step.fixture
+                stats = self.fixtures.setdefault(scope, {}).setdefault(name, {}).setdefault(phase, [0, 0.0])
+                stats[0] += count
+                stats[1] += total
+
+            title = text_type(step.name)
+            stats = self.steps.get(title)
+            if stats is None:
+                self.steps[title] = [count, total, longest]
+            else:
+                stats[0] += count
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+
+    def to_dict(self):
+        """
+        Returns the summary as a JSON-friendly dict, durations are in milliseconds
+        """
+        slowest_by_total = TopK(self.size)
+        slowest_by_max = TopK(self.size)
+        for title, (count, total, longest) in iteritems(self.steps):
+            slowest_by_total.add(total, (title, count, total, longest))
+            slowest_by_max.add(longest, (title, longest))
+
+        def rollup(durations):
+            ordered = sorted(durations)
+            return {'count': len(ordered),
+                    'total_ms': round(sum(ordered), 3),
+                    'p50_ms': round(percentile(ordered, 0.5), 3),
+                    'p95_ms': round(percentile(ordered, 0.95), 3),
+                    'p99_ms': round(percentile(ordered, 0.99), 3)}
+
+        summary = {
+            'tests': {'count': self.count, 'total_ms': round(self.total, 3)},
+            'slowest_tests': [{'module': module, 'name': name, 'duration_ms': round(duration, 3)}
+                              for (module, name, duration) in self.slowest_tests.items()],
+            'slowest_steps_by_total': [{'title': title, 'count': count, 'total_ms': round(total, 3), 'max_ms': round(longest, 3)}
+                                       for (title, count, total, longest) in slowest_by_total.items()],
+            'slowest_steps_by_max': [{'title': title, 'max_ms': round(longest, 3)}
+                                     for (title, longest) in slowest_by_max.items()],
+        }
+        for group, durations in iteritems(self.groups):
+            summary[group] = dict((name, rollup(values)) for (name, values) in iteritems(durations))
+
+        summary['fixtures'] = {}
+        for scope, fixtures in iteritems(self.fixtures):
+            summary['fixtures'][scope] = {
+                'total_ms': round(sum(total for phases in fixtures.values() for (_, total) in phases.values()), 3),
+                'fixtures': dict((name, dict((phase, {'count': count, 'total_ms': round(total, 3)})
+                                             for (phase, (count, total)) in iteritems(phases)))
+                                 for (name, phases) in iteritems(fixtures))}
+
+        return summary
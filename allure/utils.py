@@ -9,15 +9,14 @@ Created on Oct 22, 2013
 '''
 
 import time
-import hashlib
 import inspect
 import os
 import threading
-import platform
-import socket
+import string
 
-from six import text_type, binary_type
-from six.moves import filter
+from collections import deque
+from six import text_type, binary_type, integer_types, python_2_unicode_compatible
+from six.moves import filter, reprlib
 from traceback import format_exception_only
 
 from _pytest.python import Module
@@ -56,19 +55,33 @@ def uid(name):
     """
     Generates fancy UID uniquely for ``name`` by the means of hash function
     """
+    import hashlib
+
     return hashlib.sha256(name).hexdigest()
 
 
+try:
+    perf_counter = time.perf_counter
+except AttributeError:  # python 2
+    perf_counter = time.time
+
+# wall clock time at zero of ``perf_counter``, read once per process,
+# so durations are measured by the monotonic high-resolution clock and not skewed by wall clock adjustments
+CLOCK_EPOCH = time.time() - perf_counter()
+
+
 def now():
     """
-    Return current time in the allure-way representation. No further conversion required.
+    Return current time in milliseconds since the epoch, with a sub-millisecond fraction.
+
+    :py:class:`allure.rules.Timestamp` rounds it to the allure-way representation on serialization.
     """
-    return sec2ms(time.time())
+    return (CLOCK_EPOCH + perf_counter()) * 1000.0
 
 
 def labels_of(item):
     """
-    Returns list of TestLabel elements.
+    Returns list of TestLabel elements, those are interned (see :py:meth:`allure.structure.TestLabel.interned`).
     """
 
     # FIXME: utils should not depend on structure, actually
@@ -91,15 +104,15 @@ def labels_of(item):
     for label_marker in label_markers:
         label_name = label_marker.name.split('.', 1)[-1]
         for label_value in label_marker.args or ():
-            labels.append(TestLabel(name=label_name, value=label_value))
+            labels.append(TestLabel.interned(label_name, label_value))
 
     if not any(l.name == Label.SEVERITY for l in labels):
-        labels.append(TestLabel(name=Label.SEVERITY, value=Severity.NORMAL))
+        labels.append(TestLabel.interned(Label.SEVERITY, Severity.NORMAL))
 
-    labels.append(TestLabel(name=Label.THREAD, value=thread_tag()))
-    labels.append(TestLabel(name=Label.HOST, value=host_tag()))
-    labels.append(TestLabel(name=Label.FRAMEWORK, value='pytest'))
-    labels.append(TestLabel(name=Label.LANGUAGE, value=platform_tag()))
+    labels.append(TestLabel.interned(Label.THREAD, thread_tag()))
+    labels.append(TestLabel.interned(Label.HOST, host_tag()))
+    labels.append(TestLabel.interned(Label.FRAMEWORK, 'pytest'))
+    labels.append(TestLabel.interned(Label.LANGUAGE, platform_tag()))
 
     return labels
 
@@ -131,6 +144,21 @@ def unicodify(something):
             return u'<nonpresentable %s>' % type(something)  # @UndefinedVariable
 
 
+def elide(text, limit):
+    """
+    Returns ``text`` cut to about ``limit`` bytes of utf-8, keeping its head and tail with a note of how much is omitted
+    """
+    data = unicodify(text).encode('utf-8')
+    if len(data) <= limit:
+        return text
+
+    half = limit // 2
+    head, tail = data[:half], data[len(data) - half:]
+    return u'%s\n... %d bytes omitted ...\n%s' % (head.decode('utf-8', 'ignore'),
+                                                  len(data) - len(head) - len(tail),
+                                                  tail.decode('utf-8', 'ignore'))
+
+
 def present_exception(e):
     """
     Try our best at presenting the exception in a readable form
@@ -164,6 +192,8 @@ def host_tag():
     """
     Return a special host_tag value, representing current host.
     """
+    import socket
+
     return socket.gethostname()
 
 
@@ -171,6 +201,8 @@ def platform_tag():
     """
     Return a special platform_tag value represent python type and version
     """
+    import platform
+
     major_version, _, __ = platform.python_version_tuple()
     implementation = platform.python_implementation()
     return '{implementation}{major_version}'.format(implementation=implementation.lower(),
@@ -181,3 +213,110 @@ def mangle_testnames(names):
     names = [x.replace(".py", "") for x in names if x != '()']
     names[0] = names[0].replace("/", '.')
     return names
+
+
+def case_name(item):
+    """
+    Returns name of the test case for ``item`` as it goes to the report
+    """
+    return '.'.join(mangle_testnames([x.name for x in parent_down_from_module(item)]))
+
+
+def collector_name(nodeid):
+    """
+    Returns name of the collection phase test case for a collector (mostly a module) with ``nodeid``
+    """
+    return '.'.join(mangle_testnames(nodeid.split('::')))
+
+
+class BoundedFormatter(string.Formatter):
+    """
+    Formatter that renders every field in at most ``limit`` characters.
+
+    Containers are rendered via :py:mod:`reprlib`, so big ones are never converted as a whole.
+    """
+
+    CONTAINERS = (list, tuple, dict, set, frozenset, deque)
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.repr = reprlib.Repr()
+        self.repr.maxstring = self.repr.maxother = limit
+
+    def convert_field(self, value, conversion):
+        if conversion == 'r':
+            return self.repr.repr(value)
+        return super(BoundedFormatter, self).convert_field(value, conversion)
+
+    def format_field(self, value, format_spec):
+        if isinstance(value, self.CONTAINERS) and not format_spec:
+            value = self.repr.repr(value)
+        elif isinstance(value, (text_type, binary_type)):
+            value = value[:self.limit + 1]
+
+        text = format(value, format_spec)
+
+        if len(text) > self.limit:
+            return text[:self.limit - 3] + '...'
+        return text
+
+
+TITLE_FORMATTER = BoundedFormatter(limit=256)
+
+# values that are kept as is until the title is rendered, all the others are rendered on capture
+IMMUTABLE_TYPES = (text_type, binary_type, float, bool, type(None)) + integer_types
+
+
+@python_2_unicode_compatible
+class StepTitle(object):
+    """
+    Step title formatted from the arguments of a decorated call, see :py:class:`allure.common.StepContext`.
+
+    Immutable arguments are kept as is and formatted only when the title is rendered (i.e. the step is serialized),
+    the others are rendered at once, so changes made to them later do not leak into the title.
+    Every field is bounded by :py:data:`TITLE_FORMATTER`.
+
+    Pickles as the rendered text.
+    """
+
+    __slots__ = ('parts', 'text')
+
+    def __init__(self, template, args, kwargs):
+        self.parts = []
+        self.text = None
+
+        auto_index = 0
+        for literal, field_name, format_spec, conversion in TITLE_FORMATTER.parse(template):
+            if field_name is None:
+                self.parts.append((literal, None, None))
+                continue
+
+            if field_name == '':
+                field_name, auto_index = str(auto_index), auto_index + 1
+
+            value = TITLE_FORMATTER.convert_field(TITLE_FORMATTER.get_field(field_name, args, kwargs)[0], conversion)
+            if '{' in format_spec:
+                format_spec = TITLE_FORMATTER.vformat(format_spec, args, kwargs)
+
+            if isinstance(value, IMMUTABLE_TYPES):
+                self.parts.append((literal, value, format_spec))
+            else:
+                self.parts.append((literal, TITLE_FORMATTER.format_field(value, format_spec), ''))
+
+    def __str__(self):
+        if self.text is None:
+            self.text = u''.join(literal + (TITLE_FORMATTER.format_field(value, format_spec) if format_spec is not None else u'')
+                                 for (literal, value, format_spec) in self.parts)
+        return self.text
+
+    def __eq__(self, other):
+        return text_type(self) == text_type(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(text_type(self))
+
+    def __reduce__(self):
+        return text_type, (text_type(self),)
@@ -0,0 +1,341 @@
+"""
+Writers of the report data.
+
+:py:class:`allure.common.AllureImpl` and the pytest plugin build :py:mod:`allure.structure` objects
+and hand them to a writer, that decides where and in which form those go.
+
+A writer is chosen by the ``--allure-writer`` option: one of ``WRITERS`` or a ``module:Class`` of a custom writer,
+that is constructed with the ``--alluredir`` value.
+
+Modules that take a while to import (lxml, zipfile, json) are imported by the writers that use them,
+so a session that writes no report does not pay for those.
+"""
+
+import os
+import uuid
+import hashlib
+from contextlib import contextmanager
+from importlib import import_module
+
+import py
+from six import text_type
+
+from allure.constants import Status
+
+
+class Writer(object):
+    """
+    Base writer, subclasses should implement all of the ``write_*`` methods.
+
+    Streaming writers (that have ``streaming`` set) get every test case from the pytest plugin
+    as soon as it is reported via ``write_case``, instead of whole suites at the end of the session.
+
+    ``tag`` goes to names of the suite files, so those of concurrent writers to the same place are told apart.
+    """
+
+    streaming = False
+    tag = None
+
+    def write_case(self, module_id, module_name, module_doc, case):
+        """
+        Writes :py:class:`allure.structure.TestCase` ``case`` of the module with nodeid ``module_id``.
+
+        Is called for streaming writers only, the same case may be written again (with the same ``case.id``).
+        """
+        raise NotImplementedError
+
+    def write_suite(self, suite):
+        """
+        Writes :py:class:`allure.structure.TestSuite` ``suite`` with its cases
+        """
+        raise NotImplementedError
+
+    def write_environment(self, environment):
+        """
+        Writes :py:class:`allure.structure.Environment` ``environment``
+        """
+        raise NotImplementedError
+
+    def write_attachment(self, body, attach_type):
+        """
+        Writes attachment ``body`` of :py:class:`allure.constants.AttachmentType` ``attach_type``
+        and returns its file name (that goes to ``source`` of :py:class:`allure.structure.Attach`).
+
+        ``body`` is bytes or text, text is written as utf-8.
+        """
+        raise NotImplementedError
+
+    def write_file(self, filename, text):
+        """
+        Writes an auxiliary file (such as ``summary.json``) with ``text``
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Called once everything is written
+        """
+
+    @staticmethod
+    def attachment_name(attach_type):
+        return "%s-attachment.%s" % (uuid.uuid4(), attach_type.extension)
+
+    def suite_name(self):
+        if self.tag:
+            return '%s-%s-testsuite.xml' % (uuid.uuid4(), self.tag)
+        return '%s-testsuite.xml' % uuid.uuid4()
+
+    @staticmethod
+    def to_xml(xmlfied):
+        from lxml import etree
+
+        return etree.tostring(xmlfied.toxml(), pretty_print=True, xml_declaration=False, encoding=text_type)
+
+
+class XMLDirectoryWriter(Writer):
+    """
+    Writes Allure 1 XML files and attachments to directory ``logdir``, that is cleaned first if ``clean`` is set.
+    """
+
+    def __init__(self, logdir, clean=True):
+        self.logdir = os.path.normpath(
+            os.path.abspath(os.path.expanduser(os.path.expandvars(logdir))))
+
+        # Delete all files in report directory
+        if not os.path.exists(self.logdir):
+            os.makedirs(self.logdir)
+        elif clean:
+            for f in os.listdir(self.logdir):
+                f = os.path.join(self.logdir, f)
+                if os.path.isfile(f):
+                    os.unlink(f)
+
+    def write_suite(self, suite):
+        with self._reportfile(self.suite_name()) as f:
+            f.write(self.to_xml(suite))
+
+    def write_environment(self, environment):
+        with self._reportfile('environment.xml') as f:
+            f.write(self.to_xml(environment))
+
+    def write_attachment(self, body, attach_type):
+        with self._attachfile(self.attachment_name(attach_type)) as f:
+            if isinstance(body, text_type):
+                f.write(body.encode('utf-8'))
+            else:
+                f.write(body)
+            return os.path.basename(f.name)
+
+    def write_file(self, filename, text):
+        with self._reportfile(filename) as f:
+            f.write(text)
+
+    @contextmanager
+    def _attachfile(self, filename):
+        """
+        Yields open file object in the report directory with given name
+        """
+        reportpath = os.path.join(self.logdir, filename)
+
+        with open(reportpath, 'wb') as f:
+            yield f
+
+    @contextmanager
+    def _reportfile(self, filename):
+        """
+        Yields open file object in the report directory with given name
+        """
+        reportpath = os.path.join(self.logdir, filename)
+        encoding = 'utf-8'
+
+        logfile = py.std.codecs.open(reportpath, 'w', encoding=encoding)
+
+        try:
+            yield logfile
+        finally:
+            logfile.close()
+
+
+class MemoryWriter(Writer):
+    """
+    Keeps everything in memory, mostly for tests.
+
+    ``suites`` is a list of written suites, ``environment`` is the last written environment,
+    ``attachments`` and ``files`` are dicts of their contents by file names.
+    """
+
+    def __init__(self, logdir=None):
+        self.suites = []
+        self.environment = None
+        self.attachments = {}
+        self.files = {}
+        self.closed = False
+
+    def write_suite(self, suite):
+        self.suites.append(suite)
+
+    def write_environment(self, environment):
+        self.environment = environment
+
+    def write_attachment(self, body, attach_type):
+        name = self.attachment_name(attach_type)
+        self.attachments[name] = body.encode('utf-8') if isinstance(body, text_type) else body
+        return name
+
+    def write_file(self, filename, text):
+        self.files[filename] = text
+
+    def close(self):
+        self.closed = True
+
+
+class ZipWriter(Writer):
+    """
+    Writes the same files as :py:class:`XMLDirectoryWriter` into a zip archive at ``path`` (``.zip`` is appended if missing).
+    """
+
+    def __init__(self, path):
+        if not path.endswith('.zip'):
+            path += '.zip'
+
+        self.path = os.path.abspath(os.path.expanduser(os.path.expandvars(path)))
+        if not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+
+        import zipfile
+        self.archive = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED)
+
+    def write_suite(self, suite):
+        self.write_file(self.suite_name(), self.to_xml(suite))
+
+    def write_environment(self, environment):
+        self.write_file('environment.xml', self.to_xml(environment))
+
+    def write_attachment(self, body, attach_type):
+        name = self.attachment_name(attach_type)
+        self.archive.writestr(name, body.encode('utf-8') if isinstance(body, text_type) else body)
+        return name
+
+    def write_file(self, filename, text):
+        self.archive.writestr(filename, text.encode('utf-8'))
+
+    def close(self):
+        self.archive.close()
+
+
+class JSONWriter(XMLDirectoryWriter):
+    """
+    Streaming writer of the Allure 2 results to directory ``logdir``: a ``*-result.json`` file per test case
+    (named by its id, so a case that is written again replaces itself) and a ``*-container.json`` file per module.
+
+    Containers are written on close, so only ids of the cases are kept till then.
+    """
+
+    streaming = True
+
+    STATUSES = {Status.PASSED: 'passed',
+                Status.FAILED: 'failed',
+                Status.BROKEN: 'broken',
+                Status.CANCELED: 'skipped',
+                Status.PENDING: 'skipped'}
+
+    def __init__(self, logdir, clean=True):
+        super(JSONWriter, self).__init__(logdir, clean)
+        self.containers = {}  # module id => container dict
+        self.written = set()  # ids of the written cases
+
+    def write_case(self, module_id, module_name, module_doc, case):
+        container = self.containers.get(module_id)
+        if container is None:
+            container = self.containers[module_id] = {'uuid': text_type(uuid.uuid4()),
+                                                      'name': module_name,
+                                                      'description': module_doc or None,
+                                                      'children': [],
+                                                      'befores': [],
+                                                      'afters': [],
+                                                      'start': self.time(case.start),
+                                                      'stop': self.time(case.stop)}
+        case_id = text_type(case.id or uuid.uuid4())
+        if case_id not in self.written:
+            self.written.add(case_id)
+            container['children'].append(case_id)
+        container['start'] = min(container['start'], self.time(case.start))
+        container['stop'] = max(container['stop'], self.time(case.stop))
+
+        result = self.result(case)
+        result['uuid'] = case_id
+        result['fullName'] = '%s.%s' % (module_name, case.name)
+        result['historyId'] = hashlib.md5(result['fullName'].encode('utf-8')).hexdigest()
+        if not any(label['name'] == 'suite' for label in result['labels']):
+            result['labels'].append({'name': 'suite', 'value': module_name})
+
+        self._dump('%s-result.json' % case_id, result)
+
+    def write_suite(self, suite):
+        module_id = text_type(uuid.uuid4())
+        for case in suite.tests:
+            self.write_case(module_id, suite.name, suite.description, case)
+        if suite.title:
+            self.containers[module_id]['name'] = suite.title
+
+    def write_environment(self, environment):
+        self.write_file('environment.properties',
+                        u''.join(u'%s=%s\n' % (p.key, p.value) for p in environment.parameters))
+
+    def close(self):
+        for container in self.containers.values():
+            self._dump('%s-container.json' % container['uuid'], container)
+        self.containers = {}
+
+    def result(self, case):
+        """
+        Returns Allure 2 result dict of a test case or a step, without ids
+        """
+        result = {'name': case.title or case.name,
+                  'status': self.STATUSES.get(case.status, 'unknown'),
+                  'stage': 'finished',
+                  'start': self.time(case.start),
+                  'stop': self.time(case.stop),
+                  'steps': [self.result(step) for step in case.steps],
+                  'attachments': [{'name': a.title, 'source': a.source, 'type': a.type} for a in case.attachments],
+                  'parameters': []}
+
+        if isinstance(getattr(case, 'labels', None), list):  # a test case, not a step
+            result['description'] = case.description
+            result['labels'] = [{'name': l.name, 'value': text_type(l.value)} for l in case.labels]
+            if case.failure:
+                result['statusDetails'] = {'message': case.failure.message, 'trace': text_type(case.failure.trace or '')}
+
+        return result
+
+    @staticmethod
+    def time(value):
+        return int(round(value)) if value is not None else None
+
+    def _dump(self, filename, data):
+        import json
+
+        with self._reportfile(filename) as f:
+            f.write(json.dumps(data, separators=(',', ':'), ensure_ascii=False))
+
+
+WRITERS = {'xml': XMLDirectoryWriter,
+           'json': JSONWriter,
+           'memory': MemoryWriter,
+           'zip': ZipWriter}
+
+
+def writer_class(name):
+    """
+    Returns writer class by its ``name`` in ``WRITERS`` or by ``module:Class``
+
+    :raises ValueError: if there is no such writer
+    """
+    if name in WRITERS:
+        return WRITERS[name]
+
+    module, _, attr = name.partition(':')
+    try:
+        return getattr(import_module(module), attr)
+    except (ImportError, AttributeError, ValueError):
+        raise ValueError('No writer %s, it should be one of %s or module:Class' % (name, ', '.join(sorted(WRITERS))))
@@ -0,0 +1,77 @@
+"""
+Measures what importing the plugin adds to the start of a pytest session.
+
+Usage::
+
+  python benchmarks/startup.py [--repeat 10] [--verbose]
+
+Every run is a fresh interpreter, that imports pytest first (as a session does) and then the plugin.
+On Python 3.7+ the interpreter runs with ``-X importtime``, so the cost is the cumulative import time
+of the ``allure`` package as the interpreter reports it; older ones time the import themselves.
+The best time and the modules the plugin has brought in besides its own are reported.
+"""
+
+import sys
+import argparse
+import subprocess
+
+
+PROBE = '''
+import sys, time
+import pytest, _pytest.python
+before = set(sys.modules)
+start = time.time()
+import allure.pytest_plugin
+sys.stdout.write('%f\\n' % (time.time() - start))
+sys.stdout.write(' '.join(sorted(m for m in set(sys.modules) - before if not m.startswith('allure'))))
+'''
+
+IMPORTTIME_PROBE = 'import pytest, _pytest.python; import allure.pytest_plugin'
+
+
+def imported_under(output, package):
+    """
+    Returns cumulative import time in seconds of the first top-level import of ``package`` (or of its module)
+    and the modules imported under it from ``output`` of ``python -X importtime``
+    """
+    nested = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith('  '):  # nested ones are indented further
+            nested.append(name.strip())
+        elif name.strip() == package or name.strip().startswith(package + '.'):
+            return int(cumulative) / 1e6, nested
+        else:
+            nested = []
+    raise ValueError('%s is not imported' % package)
+
+
+def probe():
+    if sys.version_info >= (3, 7):
+        output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', IMPORTTIME_PROBE],
+                                         stderr=subprocess.STDOUT).decode('utf-8')
+        took, modules = imported_under(output, 'allure')
+        return took, [m for m in modules if not m.startswith('allure')]
+
+    output = subprocess.check_output([sys.executable, '-c', PROBE]).decode('utf-8').splitlines()
+    return float(output[0]), output[1].split() if len(output) > 1 else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--verbose', action='store_true', help='list the modules imported along with the plugin')
+    args = parser.parse_args(argv)
+
+    runs = [probe() for _ in range(args.repeat)]
+    best, modules = min(runs)
+    sys.stdout.write('import allure.pytest_plugin %8.1f ms, %d other modules\n' % (best * 1000, len(modules)))
+    if args.verbose:
+        for module in modules:
+            sys.stdout.write('  %s\n' % module)
+
+
+if __name__ == '__main__':
+    main()
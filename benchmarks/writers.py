@@ -0,0 +1,67 @@
+"""
+Compares throughput of the report writers on a synthetic suite.
+
+Usage::
+
+  python benchmarks/writers.py [--cases 2000] [--steps 10] [--repeat 3] [writer ...]
+
+Writers are names from :py:data:`allure.writers.WRITERS` or ``module:Class``, all of those by default.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import argparse
+import timeit
+
+from allure.constants import Status, AttachmentType
+from allure.structure import TestSuite, TestCase, TestStep, TestLabel, Attach, Failure
+from allure.writers import WRITERS, writer_class
+
+
+def make_suite(cases, steps):
+    def step(n):
+        return TestStep(name='step %d' % n, title='step %d' % n, start=1000, stop=1010, status=Status.PASSED,
+                        attachments=[], steps=[])
+
+    return TestSuite(name='benchmark', description='synthetic suite', labels=[], start=1000, stop=100000,
+                     tests=[TestCase(name='test_%d' % n,
+                                     description='case %d' % n,
+                                     status=Status.FAILED if n % 10 == 0 else Status.PASSED,
+                                     failure=Failure(message='oops', trace='trace\n' * 20) if n % 10 == 0 else None,
+                                     start=1000, stop=2000,
+                                     labels=[TestLabel(name='feature', value='feature %d' % (n % 5))],
+                                     attachments=[Attach(source='attachment.txt', title='log', type='text/plain')],
+                                     steps=[step(i) for i in range(steps)])
+                            for n in range(cases)])
+
+
+def run(name, suite, attachments):
+    directory = tempfile.mkdtemp()
+    try:
+        writer = writer_class(name)(os.path.join(directory, 'report'))
+        for _ in range(attachments):
+            writer.write_attachment(u'attachment body\n' * 10, AttachmentType.TEXT)
+        writer.write_suite(suite)
+        writer.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('writers', nargs='*', default=sorted(WRITERS))
+    args = parser.parse_args(argv)
+
+    suite = make_suite(args.cases, args.steps)
+    for name in args.writers:
+        best = min(timeit.repeat(lambda: run(name, suite, args.cases), number=1, repeat=args.repeat))
+        sys.stdout.write('%-20s %8.3f s %10.0f cases/s\n' % (name, best, args.cases / best))
+
+
+if __name__ == '__main__':
+    main()
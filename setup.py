@@ -7,7 +7,7 @@ VERSION = "1.7.10"
 
 install_requires = [
     "lxml>=3.2.0",
-    "pytest>=2.7.3",
+    "pytest>=3.0",
     "namedlist",
     "six>=1.9.0"
 ]
@@ -1,4 +1,5 @@
 import os
+import sys
 
 import pytest
 
@@ -8,6 +9,8 @@ from allure.common import AllureImpl
 
 pytest_plugins = ["pytester"]
 
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 6) else []  # it has async syntax
+
 
 @pytest.fixture
 def schema():
@@ -0,0 +1,135 @@
+"""
+Tests for writing the report in a separate process
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from functools import partial
+
+import pytest
+from hamcrest import assert_that, contains_inanyorder, has_entries, has_properties
+from six.moves import queue
+
+from allure.aggregator import serve, make_aggregator
+from allure.structure import TestSuite
+
+
+def test_writer_process(report_for, reportdir):
+    report = report_for("""
+    import pytest
+
+    def test_passed():
+        pytest.allure.attach('attached', 'data')
+        pytest.allure.environment(key='value')
+
+    def test_failed():
+        assert False
+    """, extra_run_args=['--allure-writer-process', '--allure-summary', '3'])
+
+    assert_that(report.findall('.//test-case'), contains_inanyorder(has_properties(name='test_passed'),
+                                                                    has_properties(name='test_failed')))
+
+    source = report.find('.//test-case/attachments/attachment').get('source')
+    assert reportdir.join(source).read() == 'data'
+
+    assert reportdir.join('environment.xml').check()
+    assert_that(json.loads(reportdir.join('summary.json').read()), has_entries(tests=has_entries(count=2)))
+
+
+def test_writer_process_collection_failure(reports_for):
+    reports = reports_for(test_broken="""
+    import nope
+    """, extra_run_args=['--allure-writer-process'])
+
+    assert [r.findtext('name') for r in reports] == ['test_collection_phase']
+    assert reports[0].find('.//test-case').get('status') == 'broken'
+
+
+def test_writer_process_failure(testdir):
+    testdir.makeconftest("""
+    from allure.writers import MemoryWriter
+
+    class FailingWriter(MemoryWriter):
+        def write_suite(self, suite):
+            raise IOError('disk is full')
+    """)
+    testdir.makepyfile("def test_a(): pass")
+
+    result = testdir.runpytest('--alluredir', 'report', '--allure-writer', 'conftest:FailingWriter', '--allure-writer-process')
+
+    assert result.ret != 0
+    assert 'Allure writer process failed' in result.stdout.str() + result.stderr.str()
+
+
+def test_dead_writer_process(testdir):
+    """
+    The session fails, but does not hang on exit, when the writer process dies in the middle of it
+    """
+    testdir.makeconftest("""
+    import os
+    from allure.writers import MemoryWriter
+
+    class DyingWriter(MemoryWriter):
+        def write_attachment(self, body, attach_type):
+            os._exit(3)
+    """)
+    testdir.makepyfile("""
+    import pytest
+
+    @pytest.mark.parametrize('i', range(300))
+    def test_a(i):
+        print('output ' * 1000)
+    """)
+
+    with open(str(testdir.tmpdir.join('output')), 'w') as output:
+        popen = testdir.popen([sys.executable, '-m', 'pytest', '--alluredir', 'report',
+                               '--allure-writer', 'conftest:DyingWriter', '--allure-writer-process'],
+                              stdout=output, stderr=subprocess.STDOUT)
+        deadline = time.time() + 60
+        while popen.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+        if popen.poll() is None:
+            popen.kill()
+
+    assert popen.wait() not in (0, -signal.SIGKILL)
+    assert 'Allure writer process failed with exit code 3' in testdir.tmpdir.join('output').read()
+
+
+def test_writer_process_bad_reportdir(testdir):
+    testdir.makepyfile("def test_a(): pass")
+    testdir.tmpdir.join('file').write('')
+
+    result = testdir.runpytest('--alluredir', 'file/report', '--allure-writer-process')
+
+    assert result.ret != 0
+    assert 'collected' not in result.stdout.str()  # the session fails before the tests, as it does without the subprocess
+
+
+@pytest.mark.parametrize('process', [[], ['--allure-writer-process']], ids=['in-process', 'subprocess'])
+def test_writer_process_json(testdir, process):
+    testdir.makepyfile("def test_a(): pass")
+
+    testdir.runpytest('--alluredir', 'report', '--allure-writer', 'json', *process)
+
+    assert len([f for f in os.listdir(str(testdir.tmpdir.join('report'))) if f.endswith('.json')]) == 2
+
+
+def test_serve(tmpdir):
+    """
+    What the writer process runs, in this one
+    """
+    calls = queue.Queue()
+    calls.put(('add_suite', (TestSuite(name='suite', labels=[], tests=[], start=1, stop=2),)))
+    calls.put(None)
+
+    handler = signal.getsignal(signal.SIGINT)
+    try:
+        serve(calls, partial(make_aggregator, reportdir=str(tmpdir.join('report')), writer='xml'))
+    finally:
+        signal.signal(signal.SIGINT, handler)
+
+    assert [f for f in os.listdir(str(tmpdir.join('report'))) if f.endswith('-testsuite.xml')]
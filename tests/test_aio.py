@@ -0,0 +1,148 @@
+"""
+Tests for steps of coroutines and async generators, collected on Python 3.6+ only (see ``conftest.py``)
+"""
+
+import asyncio
+
+import pytest
+
+from allure.common import StepContext
+from allure.constants import Status
+
+
+@pytest.fixture
+def case(allure_impl):
+    allure_impl.start_suite(name='A_suite')
+    allure_impl.start_case(name='A_case')
+    return allure_impl.stack[-1]
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_coroutine(allure_impl, case):
+    @StepContext(allure_impl, 'sleep {0}')
+    async def sleep(delay):
+        await asyncio.sleep(delay)
+        return delay
+
+    assert run(sleep(0)) == 0
+    assert [(s.title, s.status) for s in case.steps] == [('sleep 0', Status.PASSED)]
+
+
+def test_generator_closed_early(allure_impl, case):
+    @StepContext(allure_impl, 'numbers')
+    async def numbers():
+        yield 1
+        yield 2
+
+    async def consume():
+        gen = numbers()
+        assert await gen.__anext__() == 1
+        assert allure_impl.stack[-1] is case  # while the generator waits
+        await gen.aclose()
+
+    run(consume())
+
+    step, = case.steps
+    assert step.status == Status.PASSED and step.stop is not None
+    assert allure_impl.stack[-1] is case
+
+
+def test_generator_thrown_in(allure_impl, case):
+    @StepContext(allure_impl, 'numbers')
+    async def numbers():
+        yield 1
+        yield 2
+
+    async def consume():
+        gen = numbers()
+        assert await gen.__anext__() == 1
+        with pytest.raises(ValueError):
+            await gen.athrow(ValueError())
+
+    run(consume())
+
+    assert [s.status for s in case.steps] == [Status.FAILED]
+    assert allure_impl.stack[-1] is case
+
+
+@pytest.mark.parametrize('impl', ['allure_impl', None], ids=['steps', 'no-steps'])
+def test_generator_asend(request, impl, case):
+    @StepContext(impl and request.getfixturevalue(impl), 'echo')
+    async def echo():
+        received = yield 'ready'
+        while True:
+            received = yield received * 2
+
+    async def consume():
+        gen = echo()
+        assert await gen.asend(None) == 'ready'
+        assert await gen.asend(1) == 2
+        assert await gen.asend(21) == 42
+        await gen.aclose()
+
+    run(consume())
+
+
+def test_generator_handles_thrown_in(allure_impl, case):
+    @StepContext(allure_impl, 'numbers')
+    async def numbers():
+        try:
+            yield 1
+        except ValueError:
+            yield 'handled'
+
+    async def consume():
+        gen = numbers()
+        assert await gen.__anext__() == 1
+        assert await gen.athrow(ValueError()) == 'handled'
+        with pytest.raises(StopAsyncIteration):
+            await gen.__anext__()
+
+    run(consume())
+
+    assert [s.status for s in case.steps] == [Status.PASSED]
+
+
+def test_generator_closed_early_is_closed(allure_impl, case):
+    closed = []
+
+    @StepContext(allure_impl, 'numbers')
+    async def numbers():
+        try:
+            yield 1
+            yield 2
+        finally:
+            closed.append(True)
+
+    async def consume():
+        gen = numbers()
+        assert await gen.__anext__() == 1
+        await gen.aclose()
+
+    run(consume())
+
+    assert closed == [True]
+
+
+def test_nothing_records_steps():
+    @StepContext(None, 'sleep')
+    async def sleep():
+        return 1
+
+    @StepContext(None, 'numbers')
+    async def numbers():
+        yield 1
+        yield 2
+
+    async def consume():
+        return [i async for i in numbers()]
+
+    assert run(sleep()) == 1
+    assert run(consume()) == [1, 2]
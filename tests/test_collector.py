@@ -0,0 +1,263 @@
+"""
+Tests for streaming results to a collector over a socket
+"""
+
+import io
+import os
+import time
+import socket
+import threading
+
+import pytest
+from lxml import objectify
+
+from allure.collector import SocketAggregator, UnixCollectorServer, Collector, make_server, frame, read_frames, parse_address, main, ACK
+from allure.constants import Status, Label
+from allure.payload import PayloadEncoder
+from allure.structure import TestCase, TestLabel, TestSuite
+
+
+@pytest.fixture
+def address(tmpdir):
+    return str(tmpdir.join('collector.sock'))
+
+
+@pytest.fixture
+def collector(address):
+    """
+    Starts a collector at ``address`` in a thread, returns a function that does it
+    """
+    servers = []
+
+    def start():
+        server = make_server(address)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def payload():
+    encoder = PayloadEncoder()
+
+    def impl(name):
+        return encoder.encode('test_module.py', 'test_module', 'doc', {'key': 'value'},
+                              TestCase(id=name, name=name, status=Status.PASSED, start=1, stop=2, steps=[], attachments=[], labels=[]))
+    return impl
+
+
+def case_names(reportdir):
+    return sorted(case.findtext('name') for f in os.listdir(reportdir) if f.endswith('-testsuite.xml')
+                  for case in objectify.parse(os.path.join(reportdir, f)).getroot().findall('.//test-case'))
+
+
+def test_frames():
+    stream = io.BytesIO(frame(('a', 1)) + frame(('b', 2)) + frame(('c', 3))[:-1])
+
+    assert list(read_frames(stream)) == [('a', 1), ('b', 2)]
+
+
+def test_parse_address():
+    assert parse_address('localhost:8000') == (socket.AF_INET, ('localhost', 8000))
+    assert parse_address('/tmp/collector.sock') == (socket.AF_UNIX, '/tmp/collector.sock')
+
+
+def test_sessions(testdir, collector, address):
+    collector()
+    testdir.makepyfile(test_one="""
+    import pytest
+
+    def test_a():
+        pytest.allure.attach('attached', 'data')
+
+    def test_b():
+        assert False
+    """)
+
+    for report in ['first', 'second']:
+        result = testdir.runpytest('--alluredir', report, '--allure-collector', address)
+        assert 'INTERNALERROR' not in result.stdout.str()
+
+    for report in ['first', 'second']:
+        reportdir = str(testdir.tmpdir.join(report))
+        assert case_names(reportdir) == ['test_a', 'test_b']
+        assert len([f for f in os.listdir(reportdir) if 'attachment' in f]) == 1
+
+
+def test_reconnect(tmpdir, collector, address, payload):
+    reportdir = str(tmpdir.join('report'))
+    sink = SocketAggregator(address, batch=1, reportdir=reportdir, writer='xml')
+
+    sink.add_result('test_module.py::test_a', payload('test_a'))  # nobody listens yet
+
+    server = collector()
+    sink.add_result('test_module.py::test_b', payload('test_b'))
+
+    sink.sock.close()  # connection is lost, and the collector sees it
+    sink.add_result('test_module.py::test_c', payload('test_c'))
+    sink.finish()
+
+    assert case_names(reportdir) == ['test_a', 'test_b', 'test_c']
+    assert server.collector.sessions == {}
+    assert server.collector.impls == {}
+
+
+def test_dropped(tmpdir, collector, address, payload):
+    sink = SocketAggregator(address, batch=10, buffer=2, reportdir=str(tmpdir.join('report')), writer='xml')
+
+    for name in ['test_a', 'test_b', 'test_c']:
+        sink.add_result('test_module.py::%s' % name, payload(name))
+
+    collector()
+    with pytest.raises(RuntimeError) as e:
+        sink.finish()
+
+    assert '1 messages were dropped' in str(e.value)
+    assert case_names(str(tmpdir.join('report'))) == ['test_b', 'test_c']
+
+
+def test_no_collector(tmpdir, address, payload):
+    sink = SocketAggregator(address, timeout=0.2, reportdir=str(tmpdir.join('report')), writer='xml')
+    sink.add_result('test_module.py::test_a', payload('test_a'))
+
+    with pytest.raises(RuntimeError) as e:
+        sink.finish()
+
+    assert 'Could not send 2 messages' in str(e.value)
+
+
+def test_main(address, monkeypatch, capsys):
+    def interrupted(server):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(UnixCollectorServer, 'serve_forever', interrupted)
+    main([address])
+
+    assert capsys.readouterr()[0] == 'Collecting allure results at %s\n' % address
+
+
+def test_stalled_collector(tmpdir, address):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(address)
+    listener.listen(1)  # connections are accepted by the system, but nobody reads them
+
+    sink = SocketAggregator(address, timeout=0.2, reportdir=str(tmpdir.join('report')), writer='xml')
+    try:
+        with pytest.raises(RuntimeError) as e:
+            sink.finish()
+    finally:
+        listener.close()
+
+    assert 'did not confirm' in str(e.value)
+
+
+def test_connections_in_order(tmpdir, collector, address):
+    """
+    Messages of a connection that has started later are handled after those of the earlier one, that define a label they refer to
+    """
+    server = collector()
+    encoder = PayloadEncoder()
+    payloads = [encoder.encode('test_module.py', 'test_module', 'doc', {},
+                               TestCase(id=name, name=name, status=Status.PASSED, start=1, stop=2, steps=[], attachments=[],
+                                        labels=[TestLabel.interned(Label.FEATURE, 'feature')]))
+                for name in ('test_a', 'test_b')]
+
+    start = frame(('start', 'session', {'reportdir': str(tmpdir.join('report')), 'writer': 'xml'}))
+
+    first = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    first.connect(address)
+    first.sendall(start)
+    while 'session' not in server.collector.connections.values():
+        time.sleep(0.01)
+
+    second = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    second.settimeout(10)
+    second.connect(address)
+    second.sendall(start + frame(('add_result', ('test_module.py::test_b', payloads[1]))) + frame(('finish',)))
+    time.sleep(0.2)
+
+    first.sendall(frame(('add_result', ('test_module.py::test_a', payloads[0]))))
+    first.close()
+
+    assert second.recv(1) == ACK
+    second.close()
+
+    reportdir = str(tmpdir.join('report'))
+    labels = dict((case.findtext('name'), [l.get('value') for l in case.findall('labels/label')])
+                  for f in os.listdir(reportdir) if f.endswith('-testsuite.xml')
+                  for case in objectify.parse(os.path.join(reportdir, f)).getroot().findall('.//test-case'))
+    assert labels == {'test_a': ['feature'], 'test_b': ['feature']}
+
+
+def test_sessions_in_parallel(tmpdir):
+    """
+    A session that is slow to write does not hold up a session with another report
+    """
+    collector = Collector()
+    slow, fast = collector.accept(), collector.accept()
+    collector.call(slow, ('start', 'slow', {'reportdir': str(tmpdir.join('slow')), 'writer': 'memory'}))
+    collector.call(fast, ('start', 'fast', {'reportdir': str(tmpdir.join('fast')), 'writer': 'memory'}))
+
+    writing, written = threading.Event(), threading.Event()
+
+    def finish():
+        writing.set()
+        written.wait(5)
+
+    collector.sessions['slow'][0].finish = finish
+    thread = threading.Thread(target=collector.call, args=(slow, ('finish',)))
+    thread.start()
+    writing.wait(10)
+
+    collector.call(fast, ('add_suite', (TestSuite(name='suite', labels=[], tests=[], start=1, stop=2),)))
+    collector.call(fast, ('finish',))
+    assert 'fast' not in collector.sessions
+    assert thread.is_alive()  # the slow one is still writing
+
+    written.set()
+    thread.join()
+    assert collector.sessions == {}
+
+
+def test_session_expires(tmpdir, payload):
+    """
+    A session that has gone without finishing is finished after ``session_timeout``, so its report is written and closed
+    """
+    reportdir = str(tmpdir.join('report'))
+    collector = Collector(session_timeout=0.1)
+    number = collector.accept()
+    collector.call(number, ('start', 'session', {'reportdir': reportdir, 'writer': 'xml'}))
+    collector.call(number, ('add_result', ('test_module.py::test_a', payload('test_a'))))
+    collector.disconnect(number)
+
+    deadline = time.time() + 10
+    while collector.impls and time.time() < deadline:  # the impl is closed last
+        time.sleep(0.01)
+
+    assert collector.sessions == {}
+    assert collector.impls == {}
+    assert case_names(reportdir) == ['test_a']
+
+
+def test_session_comes_back(tmpdir, payload):
+    reportdir = str(tmpdir.join('report'))
+    collector = Collector(session_timeout=0.2)
+    number = collector.accept()
+    collector.call(number, ('start', 'session', {'reportdir': reportdir, 'writer': 'xml'}))
+    collector.disconnect(number)
+
+    number = collector.accept()
+    collector.call(number, ('start', 'session', {'reportdir': reportdir, 'writer': 'xml'}))
+    time.sleep(0.4)
+
+    assert 'session' in collector.sessions
+    collector.call(number, ('finish',))
+    assert collector.impls == {}
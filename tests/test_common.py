@@ -5,8 +5,12 @@ Created on Feb 23, 2014
 
 @author: pupssman
 """
+import pytest
 from lxml import etree
+
+from allure.common import AllureImpl
 from allure.constants import Status
+from allure.writers import MemoryWriter
 
 
 class TestCommonImpl:
@@ -36,3 +40,26 @@ class TestCommonImpl:
         allure_impl.environment.update({'foo': 'bar'})
         allure_impl.store_environment()
         assert reportdir.listdir()[0].basename == properties_file_name
+
+    def test_logdir(self, reportdir, allure_impl):
+        assert allure_impl.logdir == str(reportdir)
+        assert AllureImpl(None, writer=MemoryWriter()).logdir is None
+
+    def test_deprecated_file_helpers(self, reportdir, allure_impl, schema):
+        allure_impl.start_suite(name='A_suite')
+        allure_impl.start_case(name='A_case')
+        allure_impl.stop_case(status=Status.PASSED)
+        allure_impl.testsuite.stop = allure_impl.testsuite.start
+
+        with pytest.warns(DeprecationWarning):
+            with allure_impl._reportfile('a-testsuite.xml') as f:
+                allure_impl._write_xml(f, allure_impl.testsuite)
+
+        schema.assertValid(etree.parse(str(reportdir.join('a-testsuite.xml'))))
+
+
+def test_adaptor_names():
+    from allure import adaptor
+
+    assert [hasattr(adaptor, name) for name in ('TestCase', 'TestStep', 'Attach', 'TestSuite', 'Failure', 'TestLabel',
+                                                'AllureImpl', 'mangle_testnames')] == [True] * 8
@@ -0,0 +1,177 @@
+"""
+Tests for the recorded test durations and the ordering by them
+"""
+
+import json
+from collections import namedtuple
+
+import pytest
+
+from allure.durations import DurationDB, ResultDurations, default_path, longest_first, shard
+from allure.structure import TestSuite, TestCase
+from allure.writers import XMLDirectoryWriter
+
+
+Item = namedtuple('Item', 'nodeid')
+
+
+def write_results(path, module, durations):
+    """
+    Writes allure results of a run of ``module`` with tests that took ``durations`` (a dict of test name => milliseconds)
+    """
+    writer = XMLDirectoryWriter(str(path), clean=False)
+    writer.write_suite(TestSuite(name=module, labels=[], start=1000, stop=2000,
+                                 tests=[TestCase(name=name, status='passed', start=1000, stop=1000 + took, labels=[], steps=[], attachments=[])
+                                        for (name, took) in sorted(durations.items())]))
+    writer.close()
+
+
+def test_missing_db(tmpdir):
+    db = DurationDB(str(tmpdir.join('nope.json')))
+
+    assert db.estimate('test_a') == 0
+
+
+def test_broken_db(tmpdir):
+    path = tmpdir.join('db.json')
+    path.write('{"test_a": ')
+
+    assert DurationDB(str(path)).durations == {}
+
+
+def test_record_and_save(tmpdir):
+    path = tmpdir.join('db.json')
+    path.write(json.dumps({'test_a': 10.0, 'test_b': 30.0}))
+
+    db = DurationDB(str(path))
+    assert db.estimate('test_c') == 20
+
+    db.record('test_b', 5.04)
+    db.record('test_c', 1)
+    db.save()
+
+    assert json.loads(path.read()) == {'test_a': 10.0, 'test_b': 5.0, 'test_c': 1}
+    assert tmpdir.listdir() == [path]
+
+
+def test_default_path(tmpdir):
+    assert default_path(str(tmpdir.join('report'))) == str(tmpdir.join('report.durations.json'))
+
+
+def test_longest_first(tmpdir):
+    db = DurationDB(str(tmpdir.join('db.json')))
+    db.durations = {'a': 1, 'b': 10, 'c': 10, 'd': 5}
+
+    assert [i.nodeid for i in longest_first([Item(n) for n in 'abcd'], db)] == ['b', 'c', 'd', 'a']
+
+
+def test_longest_first_run(report_for, testdir):
+    db = testdir.tmpdir.join('durations.json')
+    db.write(json.dumps({'test_longest_first_run.py::test_a': 1.0,
+                         'test_longest_first_run.py::test_c': 100.0}))
+
+    report = report_for("""
+    def test_a():
+        pass
+
+    def test_b():
+        pass
+
+    def test_c():
+        pass
+    """, extra_run_args=['--allure-longest-first', '--allure-duration-db', str(db)])
+
+    assert [t.name for t in report.findall('.//test-case')] == ['test_c', 'test_b', 'test_a']
+    assert sorted(json.loads(db.read())) == ['test_longest_first_run.py::test_a',
+                                             'test_longest_first_run.py::test_b',
+                                             'test_longest_first_run.py::test_c']
+
+
+def test_shard(tmpdir):
+    db = DurationDB(str(tmpdir.join('db.json')))
+    db.durations = {'a': 50, 'b': 40, 'c': 30, 'd': 20, 'e': 10}
+    items = [Item(n) for n in 'abcdef']
+
+    shards = [shard(items, db, n, 2) for n in range(2)]
+
+    assert [[i.nodeid for i in selected] for (selected, _) in shards] == [['a', 'd', 'e'], ['b', 'c', 'f']]
+    assert shards[0][1] == shards[1][0]
+
+
+def test_result_durations(tmpdir):
+    write_results(tmpdir, 'test_module', {'test_a': 30, 'test_b': 10})
+
+    durations = ResultDurations.read(str(tmpdir))
+
+    assert durations.durations == {('test_module', 'test_a'): 30, ('test_module', 'test_b'): 10}
+    assert durations.estimate(('test_module', 'test_c')) == 20
+    assert [i.nodeid for i in shard([Item('test_a'), Item('test_b'), Item('test_c')], durations, 0, 2,
+                                    key=lambda item: ('test_module', item.nodeid))[0]] == ['test_a']
+
+
+def test_shard_without_history(tmpdir):
+    db = DurationDB(str(tmpdir.join('db.json')))
+    items = [Item(str(n)) for n in range(10)]
+
+    assert [len(shard(items, db, n, 3)[0]) for n in range(3)] == [4, 3, 3]
+
+
+@pytest.mark.parametrize('number, tests', [('1/2', ['test_a', 'test_c']),
+                                           ('2/2', ['test_b', 'test_d'])])
+def test_shard_run(report_for, reportdir, number, tests):
+    # results of the previous run are in the report directory itself, test_d is expected to take the average time of 63 ms
+    write_results(reportdir, 'test_shard_run', {'test_a': 100, 'test_b': 60, 'test_c': 30})
+
+    report = report_for("""
+    def test_a():
+        pass
+
+    def test_b():
+        pass
+
+    def test_c():
+        pass
+
+    def test_d():
+        pass
+    """, extra_run_args=['--allure-shard', number, '--allure-shard-from', str(reportdir)])
+
+    assert [t.name for t in report.findall('.//test-case')] == tests
+
+
+@pytest.mark.parametrize('number', ['3/2', '0/2', 'half'])
+def test_bad_shard(testdir, number):
+    result = testdir.runpytest('--alluredir', 'report', '--allure-shard', number)
+
+    assert result.ret != 0
+    assert 'I/N' in result.stderr.str() or 'is not one of' in result.stderr.str()
+
+
+def test_shard_without_previous_results(report_for, testdir):
+    report = report_for("""
+    def test_a():
+        pass
+
+    def test_b():
+        pass
+    """, extra_run_args=['--allure-shard', '2/2', '--allure-shard-from', str(testdir.tmpdir.join('nope'))])
+
+    assert [t.name for t in report.findall('.//test-case')] == ['test_b']
+
+
+def test_shard_needs_previous_results(testdir):
+    testdir.makepyfile("def test_a(): pass")
+
+    result = testdir.runpytest('--alluredir', 'report', '--allure-shard', '1/2')
+
+    assert result.ret != 0
+    assert '--allure-shard-from' in result.stderr.str()
+
+
+def test_shard_needs_report_dir(testdir):
+    testdir.makepyfile("def test_a(): pass")
+
+    result = testdir.runpytest('--allure-shard', '1/2')
+
+    assert result.ret != 0
+    assert '--alluredir' in result.stderr.str()
@@ -276,3 +276,16 @@ def test_environ_labels(report_for):
         has_label('test_foo', label_value=thread_tag(), label_name=Label.THREAD),
         has_label('test_foo', label_value=host_tag(), label_name=Label.HOST)
     ))
+
+
+def test_precise_duration_label(report_for):
+    report = report_for("""
+    import time
+
+    def test_a():
+        time.sleep(0.002)
+    """, extra_run_args=['--allure-precise-durations'])
+
+    [duration] = [label.get('value') for label in report.findall('.//label') if label.get('name') == Label.DURATION_US]
+
+    assert 2000 <= int(duration) < 1000000
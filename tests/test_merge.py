@@ -0,0 +1,88 @@
+"""
+Tests for merging of results of several runs
+"""
+
+import os
+
+import pytest
+from lxml import etree, objectify
+
+from allure.merge import main, merge
+
+
+@pytest.fixture
+def results(testdir):
+    """
+    Runs the same tests twice, each run has its own tests and both have ``test_common``
+    """
+    testdir.makepyfile(test_one="""
+    import pytest
+
+    def test_common(request):
+        pytest.allure.attach('attached', 'data')
+        pytest.allure.environment(run=request.config.option.allurereportdir)
+
+    def test_first():
+        pass
+
+    def test_second():
+        assert False
+    """)
+
+    testdir.runpytest('--alluredir', 'first', '-k', 'common or first')
+    testdir.runpytest('--alluredir', 'second', '-k', 'common or second')
+
+    return [str(testdir.tmpdir.join(d)) for d in ('first', 'second')]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_merge(results, testdir, schema, jobs):
+    out = str(testdir.tmpdir.join('out'))
+
+    assert merge(out, results, jobs=jobs) == 3
+
+    files = [f for f in os.listdir(out) if f.endswith('-testsuite.xml')]
+    assert len(files) == 1
+
+    path = os.path.join(out, files[0])
+    schema.assertValid(etree.parse(path))
+
+    suite = objectify.parse(path).getroot()
+    assert [t.name for t in suite.findall('.//test-case')] == ['test_common', 'test_first', 'test_second']
+    assert int(suite.get('stop')) >= max(int(t.get('stop')) for t in suite.findall('.//test-case'))
+
+    common = suite.find('.//test-case')
+    source = common.attachments.attachment.get('source')
+    assert source in os.listdir(os.path.join(results[1]))  # the later one is kept
+    assert open(os.path.join(out, source)).read() == 'data'
+
+    environment = objectify.parse(os.path.join(out, 'environment.xml')).getroot()
+    assert [p.value for p in environment.findall('parameter')] == ['second']
+
+
+def test_merge_main(results, testdir, capsys):
+    out = str(testdir.tmpdir.join('out'))
+
+    main([out] + results + ['--jobs', '1', '--move'])
+
+    assert 'Merged 3 test cases' in capsys.readouterr()[0]
+    assert len([f for f in os.listdir(out) if 'attachment' in f]) == 1
+
+
+def test_merge_move_shared_attachments(results, testdir):
+    """
+    Suites of different names that share an attachment are merged in parallel, the attachment is moved once
+    """
+    path = [os.path.join(results[0], f) for f in os.listdir(results[0]) if f.endswith('-testsuite.xml')][0]
+    for i in range(20):
+        suite = etree.parse(path)
+        suite.getroot().find('name').text = 'copy_%d' % i
+        suite.write(path.replace('-testsuite.xml', '-%d-testsuite.xml' % i))
+
+    out = str(testdir.tmpdir.join('out'))
+    main([out, results[0], '--jobs', '4', '--move'])
+
+    attachments = [f for f in os.listdir(out) if 'attachment' in f]
+    assert len(attachments) == 1
+    assert open(os.path.join(out, attachments[0])).read() == 'data'
+    assert [f for f in os.listdir(results[0]) if 'attachment' in f] == []
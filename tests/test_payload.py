@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for encoding of test results sent to the aggregator
+"""
+
+from allure.constants import Label, Status
+from allure.payload import PayloadEncoder, PayloadDecoder
+from allure.structure import TestCase, TestLabel, Failure
+
+
+def case(name, labels=()):
+    return TestCase(id=name, name=name, status=Status.PASSED, start=1, stop=2, steps=[], attachments=[], labels=list(labels))
+
+
+def test_modules_and_environment_sent_once():
+    encoder = PayloadEncoder()
+    environment = {'key': 'value', 'big': 'x' * 10000}
+
+    first = encoder.encode('test_a.py', 'test_a', 'A long docstring' * 1000, environment, case('test_1'))
+    second = encoder.encode('test_a.py', 'test_a', 'A long docstring' * 1000, environment, case('test_2'))
+    environment['key'] = 'other'
+    third = encoder.encode('test_b.py', 'test_b', '', environment, case('test_3'))
+
+    assert len(second) < len(first) / 10
+
+    decoder = PayloadDecoder()
+    assert decoder.decode('test_a.py::test_1', first)[:4] == ('test_a.py', 'test_a', 'A long docstring' * 1000,
+                                                              {'key': 'value', 'big': 'x' * 10000})
+    assert decoder.decode('test_a.py::test_2', second)[:4] == ('test_a.py', 'test_a', 'A long docstring' * 1000, {})
+    assert decoder.decode('test_b.py::test_3', third)[:4] == ('test_b.py', 'test_b', '', {'key': 'other'})
+    assert decoder.decode('test_b.py::test_3', third)[4].name == 'test_3'
+
+
+def test_many_encoders():
+    encoders = [PayloadEncoder(), PayloadEncoder()]
+    payloads = [(e.encode('test_%s.py' % i, 'test_%s' % i, '', {}, case('test')), 'test_%s' % i)
+                for _ in range(2) for (i, e) in enumerate(encoders)]
+
+    decoder = PayloadDecoder()
+    assert [decoder.decode('', payload)[1] for (payload, _) in payloads] == [name for (_, name) in payloads]
+
+
+def test_lost_module():
+    encoder = PayloadEncoder()
+    encoder.encode('tests/test_a.py', 'test_a', 'doc', {}, case('test_1'))  # never decoded
+
+    payload = encoder.encode('tests/test_a.py', 'test_a', 'doc', {}, case('test_2'))
+
+    assert PayloadDecoder().decode('tests/test_a.py::test_2', payload)[:3] == ('tests/test_a.py', 'tests.test_a', '')
+
+
+def test_labels_sent_once():
+    encoder = PayloadEncoder()
+    labels = [TestLabel.interned(Label.FEATURE, 'f' * 1000), TestLabel.interned(Label.FRAMEWORK, 'pytest')]
+    precise = TestLabel(name=Label.DURATION_US, value=1500)
+
+    first, second = [encoder.encode('test_a.py', 'test_a', '', {}, case(name, labels + [precise])) for name in ('test_1', 'test_2')]
+
+    assert len(second) < len(first) - 1000
+
+    decoder = PayloadDecoder()
+    cases = [decoder.decode('test_a.py::%s' % name, payload)[4] for (name, payload) in [('test_1', first), ('test_2', second)]]
+
+    assert cases[0].labels == cases[1].labels == labels + [precise]
+    assert cases[0].labels[0] is cases[1].labels[0] is labels[0]  # the same process, so the same table
+    assert cases[0].labels[2] is not cases[1].labels[2]
+
+
+def test_interned():
+    assert TestLabel.interned(Label.STORY, 'story') is TestLabel.interned(Label.STORY, 'story')
+    assert TestLabel.interned(Label.STORY, 'story').is_interned()
+    assert not TestLabel(name=Label.STORY, value='story').is_interned()
+    assert TestLabel.interned(Label.STORY, ['unhashable']) == TestLabel(name=Label.STORY, value=['unhashable'])
+
+
+def test_traces_sent_once():
+    encoder = PayloadEncoder()
+    cases = [case(name) for name in ('test_1', 'test_2', 'test_3')]
+    for (c, trace) in zip(cases, [u'Трейс' * 1000, u'Трейс' * 1000, u'other']):
+        c.failure = Failure(message='failed', trace=trace)
+
+    payloads = [encoder.encode('test_a.py', 'test_a', '', {}, c) for c in cases]
+
+    assert len(payloads[1]) < len(payloads[0]) - 1000
+    assert cases[0].failure.trace == u'Трейс' * 1000  # the case itself is left as is
+
+    decoder = PayloadDecoder()
+    assert [decoder.decode('test_a.py::test', p)[4].failure for p in payloads] == [c.failure for c in cases]
@@ -0,0 +1,93 @@
+"""
+Tests for the streaming reader of results
+"""
+
+from hamcrest import assert_that, contains, has_properties, has_entries
+
+from allure.constants import Status, Label
+from allure.reader import read_results, suite_name, suite_files
+from allure.structure import TestSuite, TestCase, TestLabel
+from allure.writers import XMLDirectoryWriter
+
+
+SOURCE = """
+'''module doc'''
+import pytest
+
+@pytest.allure.feature('one')
+def test_passed():
+    with pytest.allure.step('outer'):
+        with pytest.allure.step('inner'):
+            pytest.allure.attach('attached', 'data')
+
+@pytest.allure.feature('two')
+def test_failed():
+    assert False, 'oops'
+
+@pytest.allure.feature('two')
+def test_skipped():
+    pytest.skip('nope')
+"""
+
+
+def test_read_results(report_for, reportdir):
+    report_for(SOURCE)
+
+    results = list(read_results(str(reportdir)))
+
+    assert [case.name for (_, case) in results] == ['test_passed', 'test_failed', 'test_skipped']
+    assert len(set(id(suite) for (suite, _) in results)) == 1
+
+    suite, passed = results[0]
+    assert_that(suite, has_properties(name='test_read_results', description='module doc', tests=[]))
+    assert suite.stop >= suite.start
+
+    assert_that(passed, has_properties(status=Status.PASSED, failure=None))
+    assert_that(passed.steps, contains(has_properties(title='outer', status=Status.PASSED,
+                                                      steps=contains(has_properties(title='inner')))))
+    assert_that(passed.steps[0].steps[0].attachments, contains(has_properties(title='attached', type='text/plain')))
+    assert_that(dict((l.name, l.value) for l in passed.labels), has_entries(feature='one'))
+    assert not any(l.is_interned() for l in passed.labels)
+
+    failed = results[1][1]
+    assert 'oops' in failed.failure.message
+    assert 'assert False' in failed.failure.trace
+
+
+def test_read_results_filtered(report_for, reportdir):
+    report_for(SOURCE)
+
+    def names(**kw):
+        return [case.name for (_, case) in read_results(str(reportdir), **kw)]
+
+    assert names(statuses=[Status.FAILED, Status.CANCELED]) == ['test_failed', 'test_skipped']
+    assert names(labels=set([(Label.FEATURE, 'two')])) == ['test_failed', 'test_skipped']
+    assert names(statuses=[Status.PASSED], labels=set([(Label.FEATURE, 'two')])) == []
+
+
+def test_suite_labels(tmpdir):
+    writer = XMLDirectoryWriter(str(tmpdir))
+    writer.write_suite(TestSuite(name='suite', start=1, stop=2, labels=[TestLabel(name=Label.THREAD, value='gw0')],
+                                 tests=[TestCase(name=name, status=Status.PASSED, start=1, stop=2, labels=[], steps=[], attachments=[])
+                                        for name in ('test_a', 'test_b')]))
+    writer.close()
+
+    results = list(read_results(str(tmpdir)))
+
+    assert [case.name for (_, case) in results] == ['test_a', 'test_b']
+    assert [(l.name, l.value) for l in results[0][0].labels] == [(Label.THREAD, 'gw0')]
+
+
+def test_structures_round_trip(report_for, reportdir, schema):
+    report_for(SOURCE)
+
+    for suite, case in read_results(str(reportdir)):
+        suite.tests.append(case)
+        schema.assertValid(suite.toxml())
+        suite.tests.pop()
+
+
+def test_suite_name(report_for, reportdir):
+    report_for(SOURCE)
+
+    assert [suite_name(path) for path in suite_files(str(reportdir))] == ['test_suite_name']
@@ -0,0 +1,77 @@
+"""
+Tests for the rerun of failed tests from previous results
+"""
+
+from allure.constants import Status
+from allure.reader import failed_tests
+
+
+SOURCE = """
+import pytest
+
+def test_passed():
+    pass
+
+def test_failed():
+    assert False
+
+@pytest.mark.parametrize('x', [1, 2])
+def test_param(x):
+    assert x == 1
+
+class TestClass(object):
+    def test_broken(self, nope):
+        pass
+
+    def test_passed(self):
+        pass
+"""
+
+
+def test_failed_tests(report_for, reportdir):
+    report_for(SOURCE)
+
+    assert failed_tests(str(reportdir)) == set([('test_failed_tests', 'test_failed'),
+                                                ('test_failed_tests', 'test_param[2]'),
+                                                ('test_failed_tests', 'TestClass.test_broken')])
+
+
+def test_rerun_from_report_dir(report_for, reportdir):
+    report_for(SOURCE)
+    report = report_for(SOURCE, extra_run_args=['--allure-rerun-from', str(reportdir)])
+
+    assert [(t.name, t.get('status')) for t in report.findall('.//test-case')] == [('test_failed', Status.FAILED),
+                                                                                  ('test_param[2]', Status.FAILED),
+                                                                                  ('TestClass.test_broken', Status.BROKEN)]
+
+
+def test_rerun_from_missing_dir(testdir):
+    testdir.makepyfile("def test_a(): pass")
+
+    result = testdir.runpytest('--allure-rerun-from', 'nope')
+
+    assert result.ret != 0
+    assert 'does not exist' in result.stderr.str()
+
+
+def test_rerun_module_that_failed_to_collect(testdir, reports_for, reportdir):
+    modules = dict(test_fine="""
+    def test_a():
+        pass
+    """, test_unimportable="""
+    import helper
+
+    def test_b():
+        pass
+
+    class TestClass(object):
+        def test_c(self):
+            pass
+    """)
+    reports_for(**modules)
+
+    testdir.makepyfile(helper='')
+    reports = reports_for(extra_run_args=['--allure-rerun-from', str(reportdir)], **modules)
+
+    assert sorted((r.findtext('name'), t.name) for r in reports for t in r.findall('.//test-case')) == [
+        ('test_unimportable', 'TestClass.test_c'), ('test_unimportable', 'test_b')]
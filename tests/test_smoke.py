@@ -140,6 +140,33 @@ def test_attaches_with_capture_exist(report_for, test):
         has_entry('title', starts_with('Captured stderr'))))
 
 
+@pytest.mark.parametrize('capture,attached', [('always', ['test_failed', 'test_passed']),
+                                              ('failed', ['test_failed']),
+                                              ('never', [])])
+def test_capture_policy(report_for, capture, attached):
+    report = report_for("""
+    def test_passed():
+        print('HELLO')
+
+    def test_failed():
+        print('HELLO')
+        assert 0
+    """, extra_run_args=['--allure-capture', capture])
+
+    assert_that(sorted(case.findtext('name') for case in report.findall('.//test-case') if case.find('.//attachment') is not None),
+                is_(attached))
+
+
+def test_capture_limit(report_for, reportdir):
+    report = report_for("""
+    def test_x():
+        print('A' * 100 + 'B' * 10000 + 'C' * 100)
+    """, extra_run_args=['--allure-capture-limit', '200'])
+
+    contents = reportdir.join(report.find('.//attachment').get('source')).read()
+    assert_that(contents, is_('A' * 100 + '\n... 10001 bytes omitted ...\n' + 'C' * 99 + '\n'))
+
+
 @pytest.mark.parametrize('channel', ['err', 'out'])
 def test_attach_contents(report_for, channel):
     report = report_for("""
@@ -167,3 +194,86 @@ def test_report_directory_cleanup(report_for, reportdir):
     b = os.listdir(str(reportdir))
 
     assert_that(b, is_not(has_items(*a)))
+
+
+def test_collection_times(reports_for):
+    reports = reports_for(test_light="""
+    def test_a():
+        pass
+    """, test_heavy="""
+    import heavy_lib
+
+    def test_b():
+        pass
+    """, heavy_lib="""
+    import time
+
+    time.sleep(0.3)
+    """, test_broken="""
+    import nope
+    """, extra_run_args=['--allure-collection-times'])
+
+    collection = next(r for r in reports if r.findtext('name') == 'test_collection_phase')
+    cases = collection.findall('.//test-case')
+
+    assert_that([(case.findtext('name'), case.get('status')) for case in cases[:2]],
+                contains(('test_broken', 'broken'), ('test_heavy', 'passed')))
+    assert_that([case.findtext('name') for case in cases[2:]], contains_inanyorder('test_light', 'test_collection_times'))
+    assert_that(int(cases[1].get('stop')) - int(cases[1].get('start')), greater_than(300))
+    assert_that(cases[1].findtext('description'), is_('Imported 1 modules of heavy_lib'))
+    assert_that(cases[2].findtext('description'), is_(None))
+
+
+def test_collection_names(testdir, reports_for):
+    """
+    Failed and timed modules alike are named by their path
+    """
+    testdir.mkdir('sub')
+    reports = reports_for(extra_run_args=['--allure-collection-times'], **{'sub/test_broken': """
+    import nope
+    """, 'sub/test_fine': """
+    import json
+
+    def test_a():
+        pass
+    """})
+
+    collection = next(r for r in reports if r.findtext('name') == 'test_collection_phase')
+
+    assert_that([case.findtext('name') for case in collection.findall('.//test-case')],
+                contains_inanyorder('sub.test_broken', 'sub.test_fine', 'test_collection_names'))
+
+
+def test_lazy_imports(testdir):
+    """
+    A session without ``--alluredir`` does not import what writes the report
+    """
+    testdir.makepyfile("""
+    import sys
+
+    def test_x():
+        heavy = ['lxml', 'pickle', 'multiprocessing', 'socketserver', 'namedlist', 'hashlib',
+                 'allure.aggregator', 'allure.collector', 'allure.durations', 'allure.payload', 'allure.reader',
+                 'allure.structure', 'allure.summary', 'allure.writers']
+        assert [m for m in heavy if m in sys.modules] == []
+    """)
+
+    # pytest itself imports hashlib (for tempfile), forget it to see if the plugin imports it again
+    result = testdir.runpython_c("import sys, pytest; sys.modules.pop('hashlib', None); sys.exit(pytest.main([]))")
+
+    assert result.ret == 0
+
+
+def test_startup_imports():
+    """
+    ``benchmarks/startup.py`` (with ``python -X importtime`` on Python 3.7+) finds no report modules imported with the plugin
+    """
+    import subprocess
+    import sys
+
+    startup = os.path.join(os.path.dirname(__file__), os.pardir, 'benchmarks', 'startup.py')
+    output = subprocess.check_output([sys.executable, startup, '--repeat', '1', '--verbose']).decode('utf-8')
+    modules = [line.strip() for line in output.splitlines()[1:]]
+
+    heavy = ['lxml', 'lxml.etree', 'pickle', 'multiprocessing', 'socketserver', 'namedlist', 'hashlib', 'socket', '_socket']
+    assert [m for m in heavy if m in modules] == []
@@ -9,7 +9,9 @@ Created on Nov 3, 2013
 """
 from __future__ import absolute_import
 
+import sys
 import time
+import threading
 
 from hamcrest import assert_that, has_property, has_entry, has_properties, contains
 from hamcrest.library.number.ordering_comparison import greater_than_or_equal_to, \
@@ -17,6 +19,7 @@ from hamcrest.library.number.ordering_comparison import greater_than_or_equal_to
 from hamcrest.core.core.allof import all_of
 from .matchers import has_float
 from allure.constants import Status
+from allure.pytest_plugin import ThreadStepStack, ContextStepStack, ContextVar
 import pytest
 
 
@@ -265,3 +268,375 @@ def test_step_decorator_formatting(timed_report_for, step_name, value, expected_
     """ % (step_name, value))
 
     assert_that(report.findall('.//test-case/steps/step'), contains(step_with(expected_name, start, stop, Status.PASSED)))
+
+
+def test_collapse_repeated_steps(report_for):
+    report = report_for("""
+    import pytest
+    def test_ololo_pewpew():
+        for _ in range(5):
+            with pytest.allure.step('poll'):
+                pass
+
+        with pytest.allure.step('done'):
+            pass
+    """, extra_run_args=['--allure-collapse-steps'])
+
+    steps = report.findall('.//test-case/steps/step')
+
+    assert [s.name for s in steps] == ['poll', 'done']
+    assert steps[0].title.text.startswith('poll [x5, total ')
+    assert steps[1].title == 'done'
+
+
+def test_collapse_keeps_different_statuses(report_for):
+    report = report_for("""
+    import pytest
+    def test_ololo_pewpew():
+        for i in range(4):
+            try:
+                with pytest.allure.step('poll'):
+                    assert i % 2
+            except AssertionError:
+                pass
+    """, extra_run_args=['--allure-collapse-steps'])
+
+    assert [s.get('status') for s in report.findall('.//test-case/steps/step')] == [Status.FAILED, Status.PASSED] * 2
+
+
+def test_max_sibling_steps(report_for):
+    report = report_for("""
+    import pytest
+    def test_ololo_pewpew():
+        for i in range(10):
+            with pytest.allure.step('step %d' % i):
+                with pytest.allure.step('inner'):
+                    pass
+
+        with pytest.allure.step('failed'):
+            assert False
+    """, extra_run_args=['--allure-max-sibling-steps', '3'])
+
+    steps = report.findall('.//test-case/steps/step')
+
+    assert [s.name for s in steps] == ['step 0', 'step 1', 'step 2', 'Omitted steps']
+    assert steps[-1].title == '15 more steps omitted'
+    assert steps[-1].get('status') == Status.FAILED
+
+
+def test_max_steps(report_for):
+    report = report_for("""
+    import pytest
+    def test_ololo_pewpew():
+        for i in range(5):
+            with pytest.allure.step('step %d' % i):
+                with pytest.allure.step('inner'):
+                    pass
+    """, extra_run_args=['--allure-max-steps', '3'])
+
+    steps = report.findall('.//test-case/steps/step')
+
+    assert [s.name for s in steps] == ['step 0', 'step 1', 'Omitted steps']
+    assert steps[0].steps.step.name == 'inner'
+    assert steps[-1].title == '7 more steps omitted'
+
+
+def test_attach_to_omitted_step(report_for):
+    report = report_for("""
+    import pytest
+    def test_ololo_pewpew():
+        with pytest.allure.step('recorded'):
+            pass
+        with pytest.allure.step('omitted'):
+            pytest.allure.attach('attached', 'data')
+    """, extra_run_args=['--allure-max-steps', '1'])
+
+    assert not report.findall('.//attachment')
+
+
+def test_max_step_depth(report_for):
+    report = report_for("""
+    import pytest
+
+    @pytest.allure.step('recurse {0}')
+    def recurse(depth):
+        if depth:
+            recurse(depth - 1)
+
+    def test_ololo_pewpew():
+        recurse(5)
+        with pytest.allure.step('after'):
+            pass
+    """, extra_run_args=['--allure-max-step-depth', '2'])
+
+    steps = report.findall('.//test-case/steps/step')
+
+    assert [s.name for s in steps] == ['recurse 5', 'Omitted steps', 'after']
+    assert steps[0].steps.step.name == 'recurse 4'
+    assert not steps[0].steps.step.find('steps')
+    assert steps[1].title == '4 more steps omitted'
+
+
+def test_step_decorator_is_noop_without_report(testdir):
+    testdir.makepyfile("""
+    import allure
+
+    def foo(bar):
+        return bar
+
+    decorated_foo = allure.step('{0.no_such_attribute}')(foo)
+
+    def test_ololo_pewpew():
+        assert decorated_foo is foo
+    """)
+
+    testdir.runpytest().assert_outcomes(passed=1)
+
+
+def test_step_decorator_skips_title_formatting_outside_test():
+    from allure.pytest_plugin import AllureHelper
+
+    helper = AllureHelper()
+
+    @helper.step('{0.no_such_attribute}')
+    def foo(bar):
+        return bar
+
+    assert foo(123) == 123
+
+
+def test_steps_from_threads(report_for):
+    report = report_for("""
+    import threading
+    import pytest
+
+    def worker(i):
+        with pytest.allure.step('worker %d' % i):
+            with pytest.allure.step('inner'):
+                pytest.allure.attach('data', str(i))
+
+    def test_ololo_pewpew():
+        with pytest.allure.step('spawn'):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+            [t.start() for t in threads]
+            [t.join() for t in threads]
+
+        with pytest.allure.step('after'):
+            pass
+    """)
+
+    spawn, after = report.findall('.//test-case/steps/step')
+
+    assert after.name == 'after' and not after.steps.findall('step')
+    assert sorted(s.name for s in spawn.steps.step) == ['worker %d' % i for i in range(4)]
+    assert all([s.name for s in w.steps.step] == ['inner'] for w in spawn.steps.step)
+    assert all(len(w.steps.step.attachments.attachment) == 1 for w in spawn.steps.step)
+
+
+def test_step_left_open_in_thread(report_for):
+    report = report_for("""
+    import threading
+    import pytest
+
+    started, release = threading.Event(), threading.Event()
+
+    def worker():
+        with pytest.allure.step('background'):
+            started.set()
+            release.wait()
+
+    thread = threading.Thread(target=worker)
+
+    def test_spawn():
+        thread.start()
+        started.wait()
+
+    def test_release():
+        release.set()
+        thread.join()
+    """)
+
+    [step] = report.findall('.//test-case/steps/step')
+
+    assert step.name == 'background'
+    assert step.get('status') == 'canceled'
+    assert int(step.get('stop')) >= int(step.get('start'))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='needs contextvars')
+def test_steps_from_asyncio_tasks(report_for):
+    report = report_for("""
+    import asyncio
+    import pytest
+
+    @pytest.allure.step('operation {0}')
+    async def operation(i):
+        await asyncio.sleep(0.01 * (3 - i))
+        with pytest.allure.step('inner'):
+            await asyncio.sleep(0.01 * i)
+
+    @pytest.allure.step
+    async def numbers():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield i
+
+    async def main():
+        async with pytest.allure.step('gather'):
+            await asyncio.gather(*[operation(i) for i in range(3)])
+
+        assert [i async for i in numbers()] == [0, 1, 2]
+
+    def test_ololo_pewpew():
+        asyncio.get_event_loop().run_until_complete(main())
+    """)
+
+    gather, numbers = report.findall('.//test-case/steps/step')
+
+    assert sorted(s.name for s in gather.steps.step) == ['operation 0', 'operation 1', 'operation 2']
+    assert all([s.name for s in o.steps.step] == ['inner'] for o in gather.steps.step)
+    assert numbers.name == 'numbers' and numbers.get('status') == Status.PASSED
+    assert int(gather.get('stop')) - int(gather.get('start')) >= 25
+
+
+@pytest.mark.skipif(sys.version_info < (3, 6), reason='needs async generators')
+def test_async_generator_step_closed_early(report_for):
+    report = report_for("""
+    import asyncio
+    import pytest
+
+    @pytest.allure.step
+    async def numbers():
+        for i in range(3):
+            with pytest.allure.step('number %d' % i):
+                pass
+            yield i
+
+    async def main():
+        async for i in numbers():
+            break
+
+        with pytest.allure.step('after'):
+            pass
+
+        await asyncio.sleep(0.01)  # the generator is closed meanwhile by a task of its own
+
+    def test_ololo_pewpew():
+        asyncio.get_event_loop().run_until_complete(main())
+    """)
+
+    numbers, after = report.findall('.//test-case/steps/step')
+
+    assert numbers.name == 'numbers' and numbers.get('status') == Status.PASSED
+    assert [s.name for s in numbers.steps.step] == ['number 0']
+    assert after.name == 'after' and not after.steps.findall('step')
+
+
+@pytest.fixture(params=[ThreadStepStack, ContextStepStack], ids=['threads', 'contexts'])
+def step_stack(request):
+    if request.param is ContextStepStack and ContextVar is None:
+        pytest.skip('needs contextvars')
+
+    stack = request.param()
+    stack.start('test')
+    yield stack
+    stack.finish()
+
+
+def test_step_stack(step_stack):
+    step_stack.push('a')
+    step_stack.push('b')
+
+    assert (step_stack.top(), step_stack.depth()) == ('b', 3)
+    assert [step_stack.pop(), step_stack.pop()] == ['b', 'a']
+    assert (step_stack.top(), step_stack.depth()) == ('test', 1)
+
+    with pytest.raises(RuntimeError):
+        step_stack.pop()
+
+
+def test_step_stack_threads(step_stack):
+    seen = []
+
+    def worker():
+        step_stack.push('worker')
+        seen.append((step_stack.top(), step_stack.depth()))
+        seen.append(step_stack.pop())
+        try:
+            step_stack.pop()
+        except RuntimeError:
+            seen.append('error')
+
+    step_stack.push('spawn')
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert seen == [('worker', 3), 'worker', 'error']
+    assert step_stack.pop() == 'spawn'
+
+
+def test_fixture_steps(report_for):
+    report = report_for("""
+    import pytest
+
+    @pytest.fixture(scope='module')
+    def db():
+        yield 'db'
+
+    @pytest.fixture
+    def user(db):
+        with pytest.allure.step('create user'):
+            pass
+        yield 'user'
+
+    def test_a(user):
+        with pytest.allure.step('body'):
+            pass
+
+    def test_b(db):
+        pass
+    """, extra_run_args=['--allure-fixture-steps'])
+
+    first, second = report.findall('.//test-case')
+
+    assert [s.title for s in first.steps.findall('step')] == ['Setup fixture db', 'Setup fixture user', 'body', 'Teardown fixture user']
+    assert first.steps.findall('step')[1].steps.step.title == 'create user'
+    assert [s.title for s in second.steps.findall('step')] == ['Teardown fixture db']
+
+
+def test_fixture_teardown_failure(report_for):
+    report = report_for("""
+    import pytest
+
+    @pytest.fixture
+    def res(request):
+        request.addfinalizer(lambda: None)
+        yield 'res'
+        raise RuntimeError('teardown')
+
+    def test_a(res):
+        pass
+    """, extra_run_args=['--allure-fixture-steps'])
+
+    case = report.find('.//test-case')
+
+    assert case.get('status') == Status.BROKEN
+    steps = case.steps.findall('step')
+
+    assert [(s.title, s.get('status')) for s in steps] == [('Setup fixture res', Status.PASSED), ('Teardown fixture res', Status.FAILED)]
+
+
+def test_no_fixture_steps_by_default(report_for):
+    report = report_for("""
+    import pytest
+
+    @pytest.fixture
+    def user():
+        return 'user'
+
+    def test_a(user):
+        pass
+    """)
+
+    assert not report.findall('.//test-case/steps/step')
@@ -0,0 +1,146 @@
+"""
+Tests for the session duration summary
+"""
+
+import json
+
+from hamcrest import assert_that, has_entries, contains, has_length, has_key
+
+from allure.constants import Label
+from allure.structure import TestCase, TestStep, TestLabel
+from allure.summary import SessionSummary, percentile
+
+
+def case(name, duration, steps=(), labels=()):
+    return TestCase(id=name, name=name, start=1000.0, stop=1000.0 + duration, steps=list(steps), labels=list(labels))
+
+
+def step(name, took, steps=(), **kw):
+    return TestStep(name=name, start=1000.0, stop=1000.0 + took, steps=list(steps), **kw)
+
+
+def test_percentile():
+    ordered = list(range(1, 101))
+
+    assert [percentile(ordered, p) for p in (0.5, 0.95, 0.99, 1)] == [50, 95, 99, 100]
+
+
+def test_slowest_tests_and_steps():
+    summary = SessionSummary(2)
+    summary.add('mod', case('fast', 1, [step('a', 1)]))
+    summary.add('mod', case('slow', 30, [step('a', 10, [step('b', 9)])]))
+    summary.add('mod', case('slower', 40, [step('c', 5, repeat=5, duration=25, shortest=4, longest=6)]))
+    summary.add('mod', case('slower', 40))  # reported twice
+
+    result = summary.to_dict()
+
+    assert_that(result['tests'], has_entries(count=3, total_ms=71))
+    assert_that([t['name'] for t in result['slowest_tests']], contains('slower', 'slow'))
+    assert_that([s['title'] for s in result['slowest_steps_by_total']], contains('c', 'a'))
+    assert_that(result['slowest_steps_by_total'][0], has_entries(count=5, total_ms=25, max_ms=6))
+    assert_that([s['title'] for s in result['slowest_steps_by_max']], contains('a', 'b'))
+
+
+def test_slowest_steps_by_max_are_distinct():
+    summary = SessionSummary(2)
+    summary.add('mod', case('polling', 30, [step('poll', 10), step('poll', 9), step('poll', 8), step('other', 5)]))
+
+    result = summary.to_dict()
+
+    assert_that([s['title'] for s in result['slowest_steps_by_max']], contains('poll', 'other'))
+    assert_that(result['slowest_steps_by_max'][0], has_entries(max_ms=10))
+
+
+def test_open_steps_are_skipped():
+    summary = SessionSummary(2)
+    summary.add('mod', case('a', 5, [step('done', 2), TestStep(name='open', start=1000.0, stop=None, steps=[])]))
+
+    assert_that(summary.to_dict()['slowest_steps_by_total'], contains(has_entries(title='done')))
+
+
+def test_rollups():
+    summary = SessionSummary(5)
+    for i in range(1, 101):
+        summary.add('mod%d' % (i % 2), case('test_%d' % i, i, labels=[TestLabel(name=Label.FEATURE, value='f')]))
+
+    result = summary.to_dict()
+
+    assert_that(result['modules'], has_length(2))
+    assert_that(result['features']['f'], has_entries(count=100, p50_ms=50, p95_ms=95, p99_ms=99))
+
+
+def test_summary_file(report_for, reportdir):
+    report_for("""
+    import allure
+
+    @allure.feature('feature')
+    def test_a():
+        with allure.step('step'):
+            pass
+    """, extra_run_args=['--allure-summary', '5'])
+
+    summary = json.loads(reportdir.join('summary.json').read())
+
+    assert_that(summary['slowest_tests'], contains(has_entries(name='test_a')))
+    assert_that(summary['slowest_steps_by_max'], contains(has_entries(title='step')))
+    assert_that(summary['features'], has_key('feature'))
+
+
+def test_summary_with_step_left_open(report_for, reportdir):
+    report_for("""
+    import threading
+    import allure
+
+    started, release = threading.Event(), threading.Event()
+
+    def worker():
+        with allure.step('background'):
+            started.set()
+            release.wait()
+
+    thread = threading.Thread(target=worker)
+
+    def test_spawn():
+        thread.start()
+        started.wait()
+
+    def test_release():
+        release.set()
+        thread.join()
+    """, extra_run_args=['--allure-summary', '5'])
+
+    summary = json.loads(reportdir.join('summary.json').read())
+
+    assert_that(summary['slowest_tests'], has_length(2))
+
+
+def test_fixture_costs():
+    summary = SessionSummary(5)
+    summary.add('mod', case('a', 10, [step('Setup fixture db', 7, fixture=('db', 'session', 'setup')),
+                                      step('Setup fixture user', 2, fixture=('user', 'function', 'setup'))]))
+    summary.add('mod', case('b', 10, [step('Setup fixture user', 1, fixture=('user', 'function', 'setup')),
+                                      step('Teardown fixture user', 1, fixture=('user', 'function', 'teardown'))]))
+
+    fixtures = summary.to_dict()['fixtures']
+
+    assert_that(fixtures['session'], has_entries(total_ms=7))
+    assert_that(fixtures['function'], has_entries(total_ms=4))
+    assert_that(fixtures['function']['fixtures']['user'], has_entries(setup=has_entries(count=2, total_ms=3),
+                                                                      teardown=has_entries(count=1, total_ms=1)))
+
+
+def test_fixture_steps_summary_file(report_for, reportdir):
+    report_for("""
+    import pytest
+
+    @pytest.fixture(scope='session')
+    def db():
+        return 'db'
+
+    def test_a(db):
+        pass
+    """, extra_run_args=['--allure-fixture-steps'])
+
+    summary = json.loads(reportdir.join('summary.json').read())
+
+    assert_that(summary['fixtures']['session']['fixtures'], has_key('db'))
@@ -130,3 +130,40 @@ def test_skip_long(report_for):
     assert_that(report, has_error(message='Skipped: ' + 'ololo' * 16 + '...',
                                   status=Status.CANCELED,
                                   trace='Skipped: ' + 'ololo' * 16 + '!'))
+
+
+def test_trace_limit(report_for):
+    report = report_for("""
+    def test_X():
+        raise RuntimeError("Foo bar baz" * 1000)
+    """, extra_run_args=['--allure-trace-limit', '500'])
+
+    trace = report.find('.//test-case/failure').findtext('stack-trace')
+
+    assert_that(trace, string_contains_in_order('def test_X', 'RuntimeError: Foo bar baz', 'bytes omitted', 'RuntimeError'))
+    assert len(trace) < 600
+
+
+def test_dedupe_traces(report_for, reportdir):
+    report = report_for("""
+    import pytest
+
+    @pytest.fixture
+    def broken():
+        raise RuntimeError("Foo bar baz")
+
+    @pytest.mark.parametrize('x', range(5))
+    def test_broken(broken, x):
+        pass
+
+    def test_failed():
+        assert False
+    """, extra_run_args=['--allure-dedupe-traces'])
+
+    cases = report.findall('.//test-case')
+    sources = [case.find('attachments/attachment').get('source') for case in cases]
+    signatures = [case.failure.message.text.rsplit(' [trace ', 1)[1] for case in cases]
+
+    assert len(set(sources)) == len(set(signatures)) == 2
+    assert_that(reportdir.join(sources[0]).read(), string_contains_in_order('def broken', 'RuntimeError: Foo bar baz'))
+    assert_that(cases[0].failure.findtext('stack-trace'), has_string(string_contains_in_order('See the trace', signatures[0][:8])))
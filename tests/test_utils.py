@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
-from allure.utils import all_of, unicodify
-from hamcrest import assert_that, only_contains, equal_to
+import pickle
+import time
+import timeit
+
+from allure.utils import all_of, unicodify, elide, StepTitle, now, sec2ms
+from hamcrest import assert_that, only_contains, equal_to, has_length, less_than_or_equal_to
 import pytest
 
 
@@ -22,3 +26,50 @@ def test_all_of_ignore_name():
 ])
 def test_unicodify(arg, result):
     assert_that(unicodify(arg), equal_to(result))
+
+
+@pytest.mark.parametrize('text,limit,result', [
+    (u'short', 10, u'short'),
+    (u'0123456789' * 3, 10, u'01234\n... 20 bytes omitted ...\n56789'),
+    (u'пппппп', 6, u'\u043f\n... 6 bytes omitted ...\n\u043f'),
+    (u'пппппп', 5, u'\u043f\n... 8 bytes omitted ...\n\u043f'),
+])
+def test_elide(text, limit, result):
+    assert_that(elide(text, limit), equal_to(result))
+
+
+def test_step_title_bounds_arguments():
+    title = StepTitle(u'{0} and {1!r} and {big}', ('x' * 10000, list(range(10000))), {'big': dict.fromkeys(range(10000))})
+
+    assert_that(unicodify(title), has_length(less_than_or_equal_to(3 * 256 + 10)))
+
+
+def test_step_title_captures_mutable_arguments():
+    data = {'a': 1}
+    title = StepTitle(u'{0} {0[a]}', (data,), {})
+    data['a'] = 2
+
+    assert_that(unicodify(title), equal_to(u"{'a': 1} 1"))
+
+
+def test_step_title_pickles_as_text():
+    title = StepTitle(u'{0}-{1}', (123, u'привет'), {})
+
+    assert_that(pickle.loads(pickle.dumps(title)), equal_to(u'123-привет'))
+
+
+def test_now_is_wall_clock():
+    assert_that(abs(now() - time.time() * 1000), less_than_or_equal_to(1000))
+
+
+def test_now_overhead():
+    """
+    Check that reading the monotonic clock costs not more than the former ``sec2ms(time.time())``
+    """
+    def legacy_now():
+        return sec2ms(time.time())
+
+    legacy = min(timeit.repeat(legacy_now, number=100000, repeat=5))
+    current = min(timeit.repeat(now, number=100000, repeat=5))
+
+    assert_that(current, less_than_or_equal_to(legacy))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the writers of report data
+"""
+
+import os
+import json
+import zipfile
+
+import pytest
+from hamcrest import assert_that, contains, has_properties, has_length, has_entries, has_items
+from lxml import etree
+
+from allure.common import AllureImpl
+from allure.constants import Status, AttachmentType
+from allure.structure import TestCase
+from allure.writers import MemoryWriter, XMLDirectoryWriter, ZipWriter, JSONWriter, writer_class
+
+
+def run_session(impl):
+    impl.start_suite(name='suite')
+    impl.start_case(name='case')
+    impl.attach('text', u'данные', AttachmentType.TEXT)
+    impl.stop_case(status=Status.PASSED)
+    impl.stop_suite()
+    impl.environment.update(key='value')
+    impl.store_environment()
+    impl.close()
+
+
+def test_memory_writer():
+    writer = MemoryWriter()
+    run_session(AllureImpl(None, writer))
+
+    assert_that(writer.suites, contains(has_properties(name='suite', tests=contains(has_properties(name='case')))))
+    source = writer.suites[0].tests[0].attachments[0].source
+    assert writer.attachments == {source: u'данные'.encode('utf-8')}
+    assert [p.value for p in writer.environment.parameters] == ['value']
+    assert writer.closed
+
+
+def test_zip_writer(tmpdir, schema):
+    run_session(AllureImpl(None, ZipWriter(str(tmpdir.join('report')))))
+
+    with zipfile.ZipFile(str(tmpdir.join('report.zip'))) as archive:
+        names = archive.namelist()
+        assert_that(names, has_length(3))
+
+        suite, = [n for n in names if n.endswith('-testsuite.xml')]
+        schema.assertValid(etree.fromstring(archive.read(suite)))
+        assert 'environment.xml' in names
+
+
+def test_xml_directory_writer_keeps_files(tmpdir):
+    tmpdir.join('old.txt').write('old')
+
+    XMLDirectoryWriter(str(tmpdir), clean=False)
+    assert tmpdir.join('old.txt').check()
+
+    XMLDirectoryWriter(str(tmpdir))
+    assert not tmpdir.join('old.txt').check()
+
+
+def test_writer_class():
+    assert writer_class('memory') is MemoryWriter
+    assert writer_class('allure.writers:ZipWriter') is ZipWriter
+
+    for name in ['nope', 'allure.writers:Nope', 'nope:Nope']:
+        with pytest.raises(ValueError):
+            writer_class(name)
+
+
+@pytest.mark.parametrize('mode', [[], ['-n', '1']], ids=['local', 'xdist-parallel'])
+def test_custom_writer(testdir, mode):
+    testdir.makeconftest("""
+    from allure.writers import MemoryWriter
+
+    class RecordingWriter(MemoryWriter):
+        def close(self):
+            assert len(self.suites) == 1
+            with open('closed.txt', 'w') as f:
+                f.write(' '.join(c.name for c in self.suites[0].tests))
+    """)
+    testdir.makepyfile("""
+    def test_a():
+        pass
+
+    def test_b():
+        assert False
+    """)
+
+    testdir.runpytest('--alluredir', 'report', '--allure-writer', 'conftest:RecordingWriter', *mode)
+
+    assert testdir.tmpdir.join('closed.txt').read() == 'test_a test_b'
+    assert not testdir.tmpdir.join('report').check()
+
+
+def test_zip_writer_option(testdir):
+    testdir.makepyfile("def test_a(): pass")
+
+    testdir.runpytest('--alluredir', 'report', '--allure-writer', 'zip')
+
+    with zipfile.ZipFile(str(testdir.tmpdir.join('report.zip'))) as archive:
+        assert len([n for n in archive.namelist() if n.endswith('-testsuite.xml')]) == 1
+
+
+def test_unknown_writer(testdir):
+    result = testdir.runpytest('--alluredir', 'report', '--allure-writer', 'nope')
+
+    assert result.ret != 0
+    assert 'No writer nope' in result.stderr.str()
+
+
+def test_default_writer_dir(testdir):
+    testdir.makepyfile("def test_a(): pass")
+
+    testdir.runpytest('--alluredir', 'report')
+
+    assert any(f.endswith('-testsuite.xml') for f in os.listdir(str(testdir.tmpdir.join('report'))))
+
+
+def read_json_results(directory):
+    results, containers = [], []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('-result.json'):
+            results.append(json.load(open(os.path.join(directory, name))))
+        elif name.endswith('-container.json'):
+            containers.append(json.load(open(os.path.join(directory, name))))
+    return results, containers
+
+
+@pytest.mark.parametrize('mode', [[], ['-n', '1']], ids=['local', 'xdist-parallel'])
+def test_json_writer_option(testdir, mode):
+    testdir.makepyfile("""
+    '''module doc'''
+    import pytest
+
+    @pytest.allure.feature('feature')
+    def test_passed():
+        with pytest.allure.step('step'):
+            pytest.allure.attach('attached', 'data')
+        pytest.allure.environment(key='value')
+
+    def test_failed():
+        assert False, 'oops'
+
+    def test_skipped():
+        pytest.skip('nope')
+    """)
+
+    testdir.runpytest('--alluredir', 'report', '--allure-writer', 'json', *mode)
+
+    report = str(testdir.tmpdir.join('report'))
+    results, containers = read_json_results(report)
+
+    by_name = dict((r['name'], r) for r in results)
+    assert sorted(by_name) == ['test_failed', 'test_passed', 'test_skipped']
+    assert [by_name[n]['status'] for n in sorted(by_name)] == ['failed', 'passed', 'skipped']
+
+    passed = by_name['test_passed']
+    assert_that(passed, has_entries(fullName='test_json_writer_option.test_passed', stage='finished'))
+    assert_that(passed['labels'], has_items(has_entries(name='feature', value='feature'),
+                                            has_entries(name='suite', value='test_json_writer_option')))
+    step, = passed['steps']
+    assert_that(step, has_entries(name='step', status='passed'))
+    assert open(os.path.join(report, step['attachments'][0]['source'])).read() == 'data'
+
+    assert 'oops' in by_name['test_failed']['statusDetails']['message']
+
+    container, = containers
+    assert_that(container, has_entries(name='test_json_writer_option', description='module doc'))
+    assert sorted(container['children']) == sorted(r['uuid'] for r in results)
+
+    assert testdir.tmpdir.join('report', 'environment.properties').read() == 'key=value\n'
+
+
+def test_json_writer_rewrites_case(tmpdir):
+    writer = JSONWriter(str(tmpdir))
+    case = TestCase(id='1', name='test', status=Status.FAILED, start=1, stop=2, steps=[], attachments=[], labels=[])
+
+    writer.write_case('module', 'module', None, case)
+    case.status = Status.BROKEN
+    writer.write_case('module', 'module', None, case)
+    writer.close()
+
+    results, containers = read_json_results(str(tmpdir))
+    assert [r['status'] for r in results] == ['broken']
+    assert containers[0]['children'] == ['1']
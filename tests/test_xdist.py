@@ -4,10 +4,13 @@ Created on Oct 16, 2015
 @author: pupssman
 """
 
+import os
 import pickle
 import pytest
 import inspect
 
+from lxml import objectify
+
 import allure.structure
 
 
@@ -29,3 +32,55 @@ def test_smoke(report_for):
     def test():
         assert True
     """, extra_run_args=['-n', '2'])
+
+
+def test_worker_suites(testdir, reportdir, environment_xml):
+    testdir.makepyfile(test_one="""
+    import pytest
+
+    def test_a():
+        pytest.allure.environment(one=1)
+
+    def test_b():
+        pytest.allure.attach('attached', 'data')
+    """, test_two="""
+    def test_c():
+        assert False
+    """)
+
+    testdir.inline_run('--alluredir', str(reportdir), '--allure-worker-suites', '--allure-summary', '3', '-n', '2')
+
+    files = [f for f in os.listdir(str(reportdir)) if f.endswith('-testsuite.xml')]
+    suites = [objectify.parse(str(reportdir.join(f))).getroot() for f in files]
+
+    assert all(f.endswith(('-gw0-testsuite.xml', '-gw1-testsuite.xml')) for f in files)
+    assert all(s.find('labels/label').get('name') == 'thread' for s in suites)
+    assert sorted(case.findtext('name') for s in suites for case in s.findall('.//test-case')) == ['test_a', 'test_b', 'test_c']
+
+    source = next(a.get('source') for s in suites for a in s.findall('.//attachment'))
+    assert reportdir.join(source).read() == 'data'
+
+    assert [(p.findtext('key'), p.findtext('value')) for p in environment_xml().findall('parameter')] == [('one', '1')]
+    assert not reportdir.join('summary.json').check()
+
+
+def test_worker_suites_without_xdist(testdir, reportdir):
+    testdir.makepyfile(test_one="""
+    def test_a():
+        pass
+    """)
+
+    testdir.inline_run('--alluredir', str(reportdir), '--allure-worker-suites', '--allure-summary', '3')
+
+    assert len([f for f in os.listdir(str(reportdir)) if f.endswith('-testsuite.xml')]) == 1
+    assert reportdir.join('summary.json').check()
+
+
+@pytest.mark.parametrize('args', [['--allure-writer', 'zip'], ['--allure-writer-process']], ids=['zip', 'process'])
+def test_worker_suites_usage(testdir, args):
+    testdir.makepyfile("def test_a(): pass")
+
+    result = testdir.runpytest('--alluredir', 'report', '--allure-worker-suites', '-n', '2', *args)
+
+    assert result.ret != 0
+    assert '--allure-worker-suites' in result.stderr.str()
@@ -10,7 +10,7 @@ Created on Oct 22, 2013
 from lxml import etree
 
 
-from allure.rules import Attribute, xmlfied, Element, Nested, WrappedMany
+from allure.rules import Attribute, xmlfied, Element, Nested, WrappedMany, Timestamp
 from hamcrest.core.assert_that import assert_that
 from hamcrest.library.text.stringcontainsinorder import string_contains_in_order
 from hamcrest.core.core.allof import all_of
@@ -37,6 +37,13 @@ def test_attribute():
     assert_that(get_xml_string(a.toxml()), string_contains_in_order('<attr_test', 'foo=', '"bar"', ">"))
 
 
+def test_timestamp():
+    TimeTest = xmlfied('time_test', start=Timestamp(), stop=Timestamp())
+
+    assert_that(get_xml_string(TimeTest(start=1500.6, stop=None).toxml()),
+                string_contains_in_order('<time_test', 'start="1501"', 'stop="None"'))
+
+
 def test_nested():
     Top = xmlfied('top', foo=Nested())
     Down = xmlfied('down', bar=Element(), baz=Attribute())